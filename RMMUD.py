@@ -1,15 +1,30 @@
+import argparse
+import concurrent.futures
+import contextlib
+import dataclasses
+import functools
+import hashlib
+import io
 import json
 import logging
 import os
-import requests
+import random
 import shutil
+import sqlite3
 import sys
-import webbrowser
-import yaml
-import zipfile
+import threading
+import time
+import urllib.parse
 from datetime import datetime
 from urllib.parse import urlparse
 import typing
+try:
+    import tomllib
+except ImportError: # Python < 3.11
+    tomllib = None
+if typing.TYPE_CHECKING: # Heavy modules (requests, yaml, zipfile, webbrowser) are imported where they are first needed to keep startup fast
+    import requests
+    import zipfile
 
 __version_info__ = (3, 7, 0)
 __version__ = '.'.join(str(x) for x in __version_info__)
@@ -23,16 +38,156 @@ Config = typing.TypedDict("Config", {
     "Check for RMMUD Updates": bool,
     "Downloads Folder": str,
     "Instances Folder": str,
+    "Max Download Workers": int,
+    "Max Scan Workers": int,
+    "Modrinth API URL": str,
+    "CurseForge API URL": str,
+    "Metadata Cache TTLs": dict[str, int | None],
+    "Metadata Cache Max Entries": int,
+    "HTTP Max Retries": int,
+    "Deployment Mode": typing.Literal['copy', 'hardlink', 'reflink', 'symlink'],
+    "Lockfile Max Age": int,
+    "Download Dependencies": bool,
+    "Run Report File": str | None,
+    "Watch Interval": int,
+    "Upstream Poll Interval": int,
 })
 Instance = typing.TypedDict("Instance", {
     "Enabled": bool,
     "Loader": str,
     "Directory": str | None,
     "Mods": dict[str, list[str] | dict[str, list[str]]] | list[str] | str,
-    "Version": str
+    "Version": str,
+    "Release Channel": typing.Literal['release', 'beta', 'alpha'],
+    "World": str
 })
 Instances = dict[Instance]
-ParsedInstances = dict[str, dict[str, list[str]]]
+class ModKey(typing.NamedTuple):
+    site: str
+    project: str
+    loader: str # Mod loader, or the pack type for resource packs and datapacks and the shader loader for shader packs ('shader-iris' / 'shader-optifine')
+    game_version: str
+    mod_version: str # 'latest_<release channel>' or the version pinned in the mod URL
+
+@dataclasses.dataclass(slots = True)
+class ModJob:
+    """A mod to resolve and install, shared by every instance that wants it for the same loader and game version."""
+    key: ModKey
+    directories: set[str] = dataclasses.field(default_factory = set)
+    instances: set[str] = dataclasses.field(default_factory = set)
+
+ModJobs = dict[ModKey, ModJob]
+DeployedFiles = dict[str, dict[str, bool]] # instance directory -> file names RMMUD deployed into it -> whether an instance lists it rather than only requiring it
+Dependency = typing.TypedDict("Dependency", {
+    "project": str, # Modrinth project ID or CurseForge mod ID
+    "type": typing.Literal['required', 'incompatible']
+})
+ResolvedFile = typing.TypedDict("ResolvedFile", {
+    "site": str,
+    "project": str,
+    "loader": str,
+    "game_version": str,
+    "mod_version": str,
+    "version_id": str,
+    "file_name": str,
+    "url": str,
+    "hashes": dict[str, str],
+    "project_id": str,
+    "dependencies": list[Dependency]
+})
+LockedFile = typing.TypedDict("LockedFile", {
+    "site": str,
+    "project": str,
+    "loader": str,
+    "game_version": str,
+    "mod_version": str,
+    "version_id": str,
+    "file_name": str,
+    "url": str,
+    "hashes": dict[str, str],
+    "project_id": str,
+    "dependencies": list[Dependency],
+    "path": str # Where the file was deployed in the instance
+})
+Lockfile = typing.TypedDict("Lockfile", {
+    "instance_hash": str,
+    "resolved_at": float,
+    "files": list[LockedFile]
+})
+PlannedInstall = typing.TypedDict("PlannedInstall", {
+    "file": ResolvedFile,
+    "download": bool | None,
+    "targets": list[str]
+})
+Plan = typing.TypedDict("Plan", {
+    "installs": list[PlannedInstall],
+    "deletes": list[tuple[str, ModKey, str]], # Path, locked key and the directory of the instance it is deleted from
+    "up_to_date": int,
+    "failed": list[str],
+    "lockfiles": dict[str, Lockfile],
+    "deployed": DeployedFiles
+})
+
+MODRINTH_API_URL = 'https://api.modrinth.com/v2'
+MODRINTH_HEADERS = {'User-Agent': 'RandomGgames/RMMUD (randomggamesofficial@gmail.com)'}
+CURSEFORGE_API_URL = 'https://api.curseforge.com/v1'
+MODRINTH_PROJECTS_PER_REQUEST = 100
+MODRINTH_VERSIONS_PER_REQUEST = 200
+METADATA_CACHE_TTLS: dict[str, int | None] = {
+    "GitHub": 3600,
+    "Modrinth": 3600,
+    "Modrinth Versions": 604800,
+    "CurseForge": 3600,
+    "CurseForge IDs": None
+}
+CURSEFORGE_HASH_ALGORITHMS = {1: 'sha1', 2: 'md5'}
+CURSEFORGE_DEPENDENCY_TYPES = {3: 'required', 5: 'incompatible'} # relationType values RMMUD acts on
+CURSEFORGE_RELEASE_TYPES = {1: 'release', 2: 'beta', 3: 'alpha'}
+CURSEFORGE_FILES_PAGE_SIZE = 50
+CURSEFORGE_MAX_RESULTS = 10000 # CurseForge refuses pages past this many results
+RELEASE_CHANNELS = ('release', 'beta', 'alpha') # Most to least stable
+MODRINTH_PROJECT_TYPES = {'mod': 'mod', 'plugin': 'mod', 'resourcepack': 'resourcepack', 'shader': 'shader', 'datapack': 'datapack'} # By URL path
+CURSEFORGE_PROJECT_TYPES = {'mc-mods': 'mod', 'texture-packs': 'resourcepack', 'shaders': 'shader', 'data-packs': 'datapack'} # By URL path
+CURSEFORGE_CLASS_IDS = {'mod': 6, 'resourcepack': 12, 'shader-iris': 6552, 'shader-optifine': 6552, 'datapack': 6945}
+SHADER_LOADERS = {'fabric': 'shader-iris', 'quilt': 'shader-iris', 'neoforge': 'shader-iris'} # By mod loader, anything else uses OptiFine
+PACK_LOADERS = {'resourcepack': ('minecraft',), 'shader-iris': ('iris', 'optifine'), 'shader-optifine': ('optifine',), 'datapack': ('datapack',)} # Modrinth loaders each pack type is resolved for
+PACK_FOLDERS = {'resourcepack': 'resourcepacks', 'shader-iris': 'shaderpacks', 'shader-optifine': 'shaderpacks', 'datapack': 'datapacks'}
+PREFERRED_HASH_ALGORITHMS = ('sha1', 'sha512', 'md5')
+HASH_CHUNK_SIZE = 1024 * 1024
+PROCESS_POOL_MIN_JOBS = 64 # Fewer jobs than this are run in-process, starting worker processes would take longer
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+DOWNLOAD_TIMEOUT = (10, 60)
+HTTP_TIMEOUT = (10, 30)
+HTTP_POOL_HOSTS = 8
+HTTP_RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+HTTP_BACKOFF_BASE = 1.0
+HTTP_BACKOFF_MAX = 60.0
+HTTP_RATE_LIMIT_RESERVE = 1
+DEPLOYMENT_MODES = ('copy', 'hardlink', 'reflink', 'symlink')
+FICLONE = 0x40049409
+MOD_METADATA_FILES = { # Metadata files to look for in a jar, in order of preference for each loader
+    'fabric': ('fabric.mod.json', 'quilt.mod.json', 'META-INF/mods.toml', 'META-INF/neoforge.mods.toml', 'mcmod.info'),
+    'quilt': ('quilt.mod.json', 'fabric.mod.json', 'META-INF/mods.toml', 'META-INF/neoforge.mods.toml', 'mcmod.info'),
+    'forge': ('META-INF/mods.toml', 'mcmod.info', 'META-INF/neoforge.mods.toml', 'fabric.mod.json', 'quilt.mod.json'),
+    'neoforge': ('META-INF/neoforge.mods.toml', 'META-INF/mods.toml', 'mcmod.info', 'fabric.mod.json', 'quilt.mod.json'),
+    '': ('fabric.mod.json', 'quilt.mod.json', 'META-INF/neoforge.mods.toml', 'META-INF/mods.toml', 'mcmod.info')
+}
+YAML_LOADER = None # Set on first use to the libyaml based loader if PyYAML was built with it, as it is much faster
+UPDATE_CHECK_WAIT = 5 # Seconds a finished run waits for the background update check before giving up on it
+MOD_METADATA_READER_VERSION = 2 # Bump when readModMetadata learns new formats so indexed jars get re-read
+INSTANCE_VALIDATOR_VERSION = 1 # Bump when loadInstanceFile learns new defaults or checks so cached instances get validated again
+BUNDLE_FORMAT_VERSION = 1 # Bump when the layout of bundle.json changes
+
+job_log_buffer = threading.local()
+
+class JobLogFilter(logging.Filter):
+    """Holds back log records emitted inside a mod job so each mod's lines can be flushed together once it finishes."""
+    def filter(self, record: logging.LogRecord) -> bool:
+        records = getattr(job_log_buffer, 'records', None)
+        if records is None:
+            return True
+        records.append(record)
+        return False
 
 def extractNestedStrings(iterable: str | list | dict | tuple) -> list[str]:
     logging.debug('Extracting nested strings')
@@ -54,11 +209,23 @@ def extractNestedStrings(iterable: str | list | dict | tuple) -> list[str]:
     return extracted_strings
 
 
+def chunked(items: list, size: int) -> typing.Iterator[list]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def yamlLoader() -> type:
+    global YAML_LOADER
+    import yaml
+    if YAML_LOADER is None:
+        YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    return YAML_LOADER
+
 def readYAML(path: str) -> Config | Instance:
     logging.debug(f'Reading the YAML file "{path}".')
+    import yaml
     try:
         with open(path, 'r') as f:
-            data = yaml.load(f, yaml.SafeLoader)
+            data = yaml.load(f, yamlLoader())
             logging.debug(f'Done reading the YAML file.')
             return data
     except Exception as e:
@@ -66,29 +233,712 @@ def readYAML(path: str) -> Config | Instance:
         logging.exception(e)
         raise e
 
-def checkIfZipIsCorrupted(path: str) -> bool:
-    logging.debug(f'Checking if "{path}" is corrupted.')
+def testZip(path: str) -> str | None:
+    """Returns why a ZIP file is corrupted, or None if every entry in it is intact. Does not log so it can run in a worker process."""
+    import zipfile
     try:
         with zipfile.ZipFile(path) as zip_file:
-            zip_file.testzip()
-            logging.debug(f'The ZIP file is not corrupted.')
-            return False
+            bad_entry = zip_file.testzip()
+            return f'"{bad_entry}" is corrupted' if bad_entry is not None else None
     except zipfile.BadZipFile as e:
-        logging.warning(f'The ZIP file is corrupted or not a valid ZIP file.')
+        return repr(e)
+
+def checkIfZipIsCorrupted(path: str) -> bool:
+    logging.debug(f'Checking if "{path}" is corrupted.')
+    try:
+        problem = testZip(path)
+    except Exception as e:
+        logging.error(f'An error occurred while checking if it is corrupted.')
         logging.exception(e)
+        raise e
+    if problem is not None:
+        logging.warning(f'The ZIP file is corrupted or not a valid ZIP file: {problem}')
         return True
+    logging.debug(f'The ZIP file is not corrupted.')
+    return False
+
+def hashFile(path: str, algorithm: str) -> str:
+    """Does not log so it can run in a worker process."""
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class RunReport:
+    """Timings and counters of one run, appended as a JSON line to the Run Report File when the run ends."""
+    def __init__(self, command: str = 'run') -> None:
+        self.command = command
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+        self.stages: dict[str, float] = {}
+        self.mods: dict[str, dict[str, float]] = {}
+        self.failures: list[dict[str, str]] = []
+    
+    @contextlib.contextmanager
+    def stage(self, name: str) -> typing.Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+    
+    @contextlib.contextmanager
+    def timeMod(self, mod: str, phase: str) -> typing.Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.mods.setdefault(mod, {})[phase] = time.perf_counter() - start
+    
+    def recordFailure(self, stage: str, description: str) -> None:
+        with self.lock:
+            self.failures.append({'stage': stage, 'description': description})
+    
+    def summarize(self, client: 'HTTPClient | None', cache: 'MetadataCache | None', error: str | None = None) -> dict:
+        report = {
+            'rmmud_version': __version__,
+            'command': self.command,
+            'started_at': datetime.fromtimestamp(self.started_at).isoformat(timespec = 'seconds'),
+            'wall_time': time.perf_counter() - self.start,
+            'result': 'error' if error is not None else 'ok',
+            'error': error,
+            'stages': self.stages,
+            'mods': self.mods,
+            'failures': self.failures
+        }
+        if client is not None:
+            report['http'] = {
+                'requests': client.request_count,
+                'retries': client.retry_count,
+                'bytes_received': client.bytes_received,
+                'rate_limit_wait': client.rate_limit_wait,
+                'requests_per_host': dict(client.host_request_counts)
+            }
+        if cache is not None:
+            lookups = cache.hits + cache.misses + cache.revalidations
+            report['metadata_cache'] = {
+                'hits': cache.hits,
+                'misses': cache.misses,
+                'revalidations': cache.revalidations,
+                'hit_ratio': (cache.hits + cache.revalidations) / lookups if lookups else None
+            }
+        return report
+    
+    def write(self, path: str, report: dict) -> None:
+        try:
+            with open(path, 'a', encoding = 'utf-8') as f:
+                f.write(json.dumps(report) + '\n')
+            logging.debug(f'Appended the run report to "{path}"')
+        except Exception as e:
+            logging.warning(f'Could not write the run report to "{path}": {repr(e)}')
+
+run_report = RunReport()
+
+def describeKey(key: ModKey) -> str:
+    return f'{key.project} ({key.site}) for {key.loader} {key.game_version}'
+
+class StateDatabase:
+    """Thread safe wrapper around the SQLite file RMMUD keeps its caches and indexes in."""
+    def __init__(self, path: str) -> None:
+        logging.debug(f'Opening state database "{path}".')
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread = False)
+        self.execute('PRAGMA journal_mode=WAL')
+        self.execute('PRAGMA synchronous=NORMAL')
+    
+    def execute(self, sql: str, params: tuple = ()) -> list[tuple]:
+        with self.lock:
+            rows = self.connection.execute(sql, params).fetchall()
+            self.connection.commit()
+        return rows
+    
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+class VerifiedFileIndex:
+    """Index of files whose hash has already been computed, keyed by path, size and mtime."""
+    def __init__(self, database: StateDatabase) -> None:
+        self.database = database
+        self.database.execute("""CREATE TABLE IF NOT EXISTS verified_files (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            algorithm TEXT NOT NULL,
+            hash TEXT NOT NULL
+        )""")
+    
+    def lookup(self, path: str, stat: os.stat_result, algorithm: str) -> str | None:
+        rows = self.database.execute('SELECT hash FROM verified_files WHERE path = ? AND size = ? AND mtime_ns = ? AND algorithm = ?',
+                                     (os.path.abspath(path), stat.st_size, stat.st_mtime_ns, algorithm))
+        return rows[0][0] if rows else None
+    
+    def record(self, path: str, stat: os.stat_result, algorithm: str, file_hash: str) -> None:
+        self.database.execute('INSERT OR REPLACE INTO verified_files VALUES (?, ?, ?, ?, ?)',
+                              (os.path.abspath(path), stat.st_size, stat.st_mtime_ns, algorithm, file_hash.lower()))
+
+class MetadataCache:
+    """Cache of API responses, keyed by URL and parameters, with per-kind TTLs.
+    Hits and misses count API requests avoided and made, not rows read."""
+    def __init__(self, database: StateDatabase, ttls: dict[str, int | None], max_entries: int) -> None:
+        self.database = database
+        self.ttls = ttls
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.counter_lock = threading.Lock()
+        self.offline = False # Offline, every cached response counts as fresh
+        self.used_keys: set[str] = set()
+        self.database.execute("""CREATE TABLE IF NOT EXISTS metadata_cache (
+            key TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            body TEXT NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            fetched_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        )""")
+    
+    def isFresh(self, kind: str, fetched_at: float) -> bool:
+        ttl = self.ttls.get(kind, 0)
+        return self.offline or ttl is None or time.time() - fetched_at < ttl
+    
+    def lookup(self, key: str) -> tuple[str, str | None, str | None, float] | None:
+        with self.database.lock:
+            rows = self.database.execute('SELECT body, etag, last_modified, fetched_at FROM metadata_cache WHERE key = ?', (key,))
+            if rows:
+                self.database.execute('UPDATE metadata_cache SET accessed_at = ? WHERE key = ?', (time.time(), key))
+                self.used_keys.add(key)
+        return rows[0] if rows else None
+    
+    def count(self, hits: int = 0, misses: int = 0, revalidations: int = 0) -> None:
+        with self.counter_lock:
+            self.hits += hits
+            self.misses += misses
+            self.revalidations += revalidations
+    
+    def get(self, key: str, kind: str) -> typing.Any | None:
+        """Returns a fresh cached response, without counting a hit or miss as it may be one of many rows behind a single request."""
+        row = self.lookup(key)
+        if row is not None and self.isFresh(kind, row[3]):
+            return json.loads(row[0])
+        return None
+    
+    def put(self, key: str, kind: str, body: str, etag: str | None = None, last_modified: str | None = None) -> None:
+        now = time.time()
+        with self.database.lock:
+            self.database.execute('INSERT OR REPLACE INTO metadata_cache VALUES (?, ?, ?, ?, ?, ?, ?)', (key, kind, body, etag, last_modified, now, now))
+            self.used_keys.add(key)
+    
+    def exportRows(self, keys: set[str]) -> list[tuple[str, str, str, str | None, str | None, float]]:
+        rows = self.database.execute('SELECT key, kind, body, etag, last_modified, fetched_at FROM metadata_cache')
+        return [row for row in rows if row[0] in keys]
+    
+    def importRows(self, rows: list[tuple[str, str, str, str | None, str | None, float]]) -> None:
+        with self.database.lock:
+            for row in rows:
+                self.database.execute('INSERT OR REPLACE INTO metadata_cache VALUES (?, ?, ?, ?, ?, ?, ?)', (*row, time.time()))
+    
+    def refresh(self, key: str) -> None:
+        self.database.execute('UPDATE metadata_cache SET fetched_at = ? WHERE key = ?', (time.time(), key))
+    
+    def evict(self) -> None:
+        """Keeps at most max_entries responses. Modrinth version rows are not counted, as there is one for every version of every
+        project, and are only dropped once they have not been used for longer than their TTL."""
+        with self.database.lock:
+            version_ttl = self.ttls.get('Modrinth Versions')
+            if version_ttl is not None:
+                self.database.execute("DELETE FROM metadata_cache WHERE kind = 'Modrinth Versions' AND accessed_at < ?", (time.time() - version_ttl,))
+            count = self.database.execute("SELECT COUNT(*) FROM metadata_cache WHERE kind != 'Modrinth Versions'")[0][0]
+            if count > self.max_entries:
+                logging.debug(f'Evicting {count - self.max_entries} metadata cache entries.')
+                self.database.execute("DELETE FROM metadata_cache WHERE key IN (SELECT key FROM metadata_cache WHERE kind != 'Modrinth Versions' ORDER BY accessed_at ASC LIMIT ?)",
+                                      (count - self.max_entries,))
+
+class DownloadStore:
+    """Content addressed store of downloaded files (<root>/<sha1[:2]>/<sha1>) with a manifest of what each mod resolved to."""
+    def __init__(self, database: StateDatabase, root: str) -> None:
+        self.database = database
+        self.root = root
+        self.used_blobs: set[str] = set()
+        self.locks: dict[str, threading.Lock] = {}
+        os.makedirs(self.root, exist_ok = True)
+        columns = self.database.execute('PRAGMA table_info(store_manifest)')
+        migrate = bool(columns) and not any(row[1] == 'blob' and row[5] for row in columns) # From before a key could map to several files, e.g. when instances lock different versions of it
+        if migrate:
+            self.database.execute('ALTER TABLE store_manifest RENAME TO store_manifest_old')
+        self.database.execute("""CREATE TABLE IF NOT EXISTS store_manifest (
+            site TEXT NOT NULL,
+            project TEXT NOT NULL,
+            loader TEXT NOT NULL,
+            game_version TEXT NOT NULL,
+            mod_version TEXT NOT NULL,
+            file_name TEXT NOT NULL,
+            blob TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (site, project, loader, game_version, mod_version, blob)
+        )""")
+        if migrate:
+            self.database.execute('INSERT INTO store_manifest SELECT * FROM store_manifest_old')
+            self.database.execute('DROP TABLE store_manifest_old')
+    
+    def blobPath(self, blob: str) -> str:
+        return os.path.join(self.root, blob[:2], blob)
+    
+    def lock(self, name: str) -> threading.Lock:
+        """Lock for one blob (or incoming file name), so mods that resolve to the same file do not download it over each other."""
+        with self.database.lock:
+            return self.locks.setdefault(name, threading.Lock())
+    
+    def lookup(self, key: ModKey, file_name: str) -> str | None:
+        """Returns the blob a mod's file was last stored as."""
+        rows = self.database.execute('SELECT blob FROM store_manifest WHERE site = ? AND project = ? AND loader = ? AND game_version = ? AND mod_version = ? AND file_name = ? ' +
+                                     'ORDER BY updated_at DESC LIMIT 1', (*key, file_name))
+        return rows[0][0] if rows else None
+    
+    def record(self, key: ModKey, file_name: str, blob: str) -> None:
+        self.database.execute('INSERT OR REPLACE INTO store_manifest VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                              (*key, file_name, blob, os.path.getsize(self.blobPath(blob)), time.time()))
+        with self.database.lock:
+            self.used_blobs.add(blob)
+    
+    def deduplicationSavings(self) -> tuple[int, int, int]:
+        """Returns the number of blobs, their total size and the bytes saved by sharing blobs between manifest entries."""
+        rows = self.database.execute('SELECT size, COUNT(*) FROM store_manifest GROUP BY blob')
+        return len(rows), sum(size for size, _ in rows), sum(size * (count - 1) for size, count in rows)
+    
+    def collectGarbage(self, live_files: set[tuple[ModKey, str]]) -> tuple[int, int]:
+        """Deletes manifest entries whose (key, file name) is not in live_files and blobs nothing references anymore. Returns the number of files and bytes removed."""
+        with self.database.lock:
+            rows = self.database.execute('SELECT site, project, loader, game_version, mod_version, file_name, blob FROM store_manifest')
+            dead_rows = [row for row in rows if (row[:5], row[5]) not in live_files]
+            for row in dead_rows:
+                self.database.execute('DELETE FROM store_manifest WHERE site = ? AND project = ? AND loader = ? AND game_version = ? AND mod_version = ? AND blob = ?', (*row[:5], row[6]))
+            live_blobs = self.used_blobs | {row[6] for row in rows if (row[:5], row[5]) in live_files}
+        
+        removed_files = 0
+        removed_bytes = 0
+        for directory, _, file_names in os.walk(self.root, topdown = False):
+            for file_name in file_names:
+                if file_name.split('.')[0] in live_blobs:
+                    continue
+                path = os.path.join(directory, file_name)
+                try:
+                    size = os.path.getsize(path)
+                    os.remove(path)
+                    removed_files += 1
+                    removed_bytes += size
+                    logging.debug(f'Deleted unreferenced file "{path}"')
+                except Exception as e:
+                    logging.warning(f'Could not delete unreferenced file "{path}": {e}')
+            if directory != self.root and not os.listdir(directory):
+                os.rmdir(directory)
+        return removed_files, removed_bytes
+
+class ModFileIndex:
+    """Index of the mod id and version inside each jar of a mods folder, keyed by file name, size and mtime."""
+    def __init__(self, database: StateDatabase) -> None:
+        self.database = database
+        columns = {row[1] for row in self.database.execute('PRAGMA table_info(mod_files)')}
+        if columns and 'reader_version' not in columns:
+            self.database.execute('DROP TABLE mod_files')
+        self.database.execute("""CREATE TABLE IF NOT EXISTS mod_files (
+            directory TEXT NOT NULL,
+            file_name TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            mod_id TEXT,
+            mod_version TEXT,
+            reader_version INTEGER NOT NULL,
+            PRIMARY KEY (directory, file_name)
+        )""")
+    
+    def load(self, directory: str) -> dict[str, tuple[int, int, str | None, str | None]]:
+        rows = self.database.execute('SELECT file_name, size, mtime_ns, mod_id, mod_version FROM mod_files WHERE directory = ? AND reader_version = ?',
+                                     (os.path.abspath(directory), MOD_METADATA_READER_VERSION))
+        return {row[0]: row[1:] for row in rows}
+    
+    def save(self, directory: str, entries: dict[str, tuple[int, int, str | None, str | None]]) -> None:
+        directory = os.path.abspath(directory)
+        with self.database.lock:
+            self.database.execute('DELETE FROM mod_files WHERE directory = ?', (directory,))
+            for file_name, entry in entries.items():
+                self.database.execute('INSERT INTO mod_files VALUES (?, ?, ?, ?, ?, ?, ?)', (directory, file_name, *entry, MOD_METADATA_READER_VERSION))
+
+class InstanceCache:
+    """Cache of validated instance files keyed by file name, size and mtime so unchanged files are not parsed again."""
+    def __init__(self, database: StateDatabase) -> None:
+        self.database = database
+        columns = {row[1] for row in self.database.execute('PRAGMA table_info(instance_files)')}
+        if columns and 'validator_version' not in columns:
+            self.database.execute('DROP TABLE instance_files')
+        self.database.execute("""CREATE TABLE IF NOT EXISTS instance_files (
+            directory TEXT NOT NULL,
+            file_name TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            instance TEXT NOT NULL,
+            validator_version INTEGER NOT NULL,
+            PRIMARY KEY (directory, file_name)
+        )""")
+        self.database.execute('DELETE FROM instance_files WHERE validator_version != ?', (INSTANCE_VALIDATOR_VERSION,))
+    
+    def load(self, directory: str) -> dict[str, tuple[int, int, str]]:
+        rows = self.database.execute('SELECT file_name, size, mtime_ns, instance FROM instance_files WHERE directory = ? AND validator_version = ?',
+                                     (os.path.abspath(directory), INSTANCE_VALIDATOR_VERSION))
+        return {row[0]: row[1:] for row in rows}
+    
+    def save(self, directory: str, entries: dict[str, tuple[int, int, str]]) -> None:
+        directory = os.path.abspath(directory)
+        with self.database.lock:
+            self.database.execute('DELETE FROM instance_files WHERE directory = ?', (directory,))
+            for file_name, entry in entries.items():
+                self.database.execute('INSERT INTO instance_files VALUES (?, ?, ?, ?, ?, ?)', (directory, file_name, *entry, INSTANCE_VALIDATOR_VERSION))
+
+state_database: StateDatabase | None = None
+metadata_cache: MetadataCache | None = None
+verified_files: VerifiedFileIndex | None = None
+download_store: DownloadStore | None = None
+mod_file_index: ModFileIndex | None = None
+instance_cache: InstanceCache | None = None
+
+def setupStateDatabase(config: Config) -> StateDatabase:
+    global state_database, metadata_cache, verified_files, download_store, mod_file_index, instance_cache
+    logging.debug(f'Setting up state database')
+    try:
+        os.makedirs(config['Downloads Folder'], exist_ok = True)
+        state_database = StateDatabase(os.path.join(config['Downloads Folder'], 'RMMUDCache.sqlite3'))
+        metadata_cache = MetadataCache(state_database, config['Metadata Cache TTLs'], config['Metadata Cache Max Entries'])
+        verified_files = VerifiedFileIndex(state_database)
+        download_store = DownloadStore(state_database, os.path.join(config['Downloads Folder'], 'store'))
+        mod_file_index = ModFileIndex(state_database)
+        instance_cache = InstanceCache(state_database)
     except Exception as e:
-        logging.error(f'An error occurred while checking if it is corrupted.')
+        logging.error(f'Could not set up the state database.')
         logging.exception(e)
         raise e
+    return state_database
+
+def closeStateDatabase() -> None:
+    global state_database, metadata_cache, verified_files, download_store, mod_file_index, instance_cache
+    logging.debug(f'Closing state database')
+    if metadata_cache is not None:
+        metadata_cache.evict()
+        logging.info(f'Metadata cache: {metadata_cache.hits} hit(s), {metadata_cache.misses} miss(es), {metadata_cache.revalidations} revalidated.')
+    if state_database is not None:
+        state_database.close()
+    state_database, metadata_cache, verified_files, download_store, mod_file_index, instance_cache = None, None, None, None, None, None
+
+def pickHashAlgorithm(hashes: dict[str, str]) -> str | None:
+    return next((algorithm for algorithm in PREFERRED_HASH_ALGORITHMS if hashes.get(algorithm)), None)
+
+def verifyFile(path: str, hashes: dict[str, str]) -> bool:
+    """Checks a file against its expected hashes, only re-hashing it if it changed since it was last verified."""
+    logging.debug(f'Verifying "{path}".')
+    algorithm = pickHashAlgorithm(hashes)
+    if algorithm is None:
+        logging.debug(f'No known hash to verify against, checking the ZIP file instead.')
+        return not checkIfZipIsCorrupted(path)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return False
+    file_hash = verified_files.lookup(path, stat, algorithm) if verified_files is not None else None
+    if file_hash is None:
+        logging.debug(f'Hashing "{path}" with {algorithm}.')
+        file_hash = hashFile(path, algorithm)
+        if verified_files is not None:
+            verified_files.record(path, stat, algorithm, file_hash)
+    if file_hash != hashes[algorithm].lower():
+        logging.warning(f'"{path}" does not match its expected {algorithm} hash.')
+        return False
+    logging.debug(f'"{path}" matches its expected {algorithm} hash.')
+    return True
+
+def digestFile(path: str, algorithm: str | None) -> str | None:
+    """Hashes a file, or tests it as a ZIP file when there is no algorithm ('' if it is intact).
+    Returns None if the file could not be read or is corrupted. Does not log so it can run in a worker process."""
+    try:
+        if algorithm is None:
+            return '' if testZip(path) is None else None
+        return hashFile(path, algorithm)
+    except Exception:
+        return None
+
+def verifyFiles(files: list[tuple[str, dict[str, str]]], max_workers: int = 1) -> list[bool]:
+    """Checks many (path, hashes) like verifyFile does, hashing the files that changed since they were last verified on a process pool."""
+    results = [False] * len(files)
+    pending: list[tuple[int, str, os.stat_result, str | None]] = []
+    for index, (path, hashes) in enumerate(files):
+        algorithm = pickHashAlgorithm(hashes)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        file_hash = verified_files.lookup(path, stat, algorithm) if verified_files is not None and algorithm is not None else None
+        if file_hash is None:
+            pending.append((index, path, stat, algorithm))
+        else:
+            results[index] = file_hash == hashes[algorithm].lower()
+    
+    logging.debug(f'{len(files) - len(pending)} file(s) unchanged since they were last verified, verifying {len(pending)} file(s)')
+    digests = runProcessJobs(digestFile, [(path, algorithm) for _, path, _, algorithm in pending], max_workers)
+    for (index, path, stat, algorithm), digest in zip(pending, digests):
+        hashes = files[index][1]
+        results[index] = digest == (hashes[algorithm].lower() if algorithm is not None else '')
+        if algorithm is not None and digest is not None and verified_files is not None:
+            verified_files.record(path, stat, algorithm, digest)
+        if not results[index]:
+            logging.warning(f'"{path}" does not match its expected {algorithm} hash.' if algorithm is not None else f'"{path}" is corrupted or not a valid ZIP file.')
+    return results
+
+def markFileVerified(path: str, hashes: dict[str, str]) -> None:
+    """Records a file that is known to match its hashes (e.g. a fresh copy of a verified file) without hashing it."""
+    algorithm = pickHashAlgorithm(hashes)
+    if algorithm is not None and verified_files is not None:
+        verified_files.record(path, os.stat(path), algorithm, hashes[algorithm])
+
+class OfflineError(Exception):
+    """Raised when offline mode needs something that is not in the local cache or the imported bundle."""
+
+class HTTPClient:
+    """Shared requests session with per-host connection pools, retries with backoff and rate limit handling."""
+    def __init__(self, pool_size: int = 10, max_retries: int = 5, offline: bool = False) -> None:
+        self.pool_size = pool_size
+        self._session: 'requests.Session | None' = None
+        self.max_retries = max_retries
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.rate_limited_until: dict[str, float] = {}
+        self.request_count = 0
+        self.host_request_counts: dict[str, int] = {}
+        self.retry_count = 0
+        self.bytes_received = 0
+        self.rate_limit_wait = 0.0
+    
+    @property
+    def session(self) -> 'requests.Session':
+        """Created on first use, as importing requests takes longer than a run with nothing to update."""
+        with self.lock:
+            if self._session is None:
+                import requests.adapters
+                self._session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections = HTTP_POOL_HOSTS, pool_maxsize = self.pool_size)
+                self._session.mount('https://', adapter)
+                self._session.mount('http://', adapter)
+            return self._session
+    
+    def waitForRateLimit(self, host: str) -> None:
+        with self.lock:
+            delay = self.rate_limited_until.get(host, 0) - time.time()
+            if delay > 0:
+                self.rate_limit_wait += delay
+        if delay > 0:
+            logging.info(f'Waiting {delay:.1f}s for the {host} rate limit to reset.')
+            time.sleep(delay)
+    
+    def updateRateLimit(self, host: str, response: 'requests.Response') -> float | None:
+        """Reads rate limit headers and returns how long to wait before the next request to this host, if at all."""
+        delay = None
+        remaining = response.headers.get('X-Ratelimit-Remaining')
+        reset = response.headers.get('X-Ratelimit-Reset')
+        retry_after = response.headers.get('Retry-After')
+        try:
+            if response.status_code == 429 and retry_after is not None:
+                delay = float(retry_after)
+            elif remaining is not None and reset is not None and (int(remaining) <= HTTP_RATE_LIMIT_RESERVE or response.status_code == 429):
+                delay = float(reset)
+        except ValueError:
+            logging.debug(f'Could not read rate limit headers from {host}.')
+        if delay is not None:
+            with self.lock:
+                self.rate_limited_until[host] = max(self.rate_limited_until.get(host, 0), time.time() + delay)
+        return delay
+    
+    def backoff(self, attempt: int) -> float:
+        delay = min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+    
+    def get(self, url: str, **kwargs) -> 'requests.Response':
+        import requests
+        host = urllib.parse.urlparse(url).netloc
+        if self.offline:
+            raise OfflineError(f'"{url}" is not available offline.')
+        kwargs.setdefault('timeout', HTTP_TIMEOUT)
+        for attempt in range(self.max_retries + 1):
+            self.waitForRateLimit(host)
+            with self.lock:
+                self.request_count += 1
+                self.host_request_counts[host] = self.host_request_counts.get(host, 0) + 1
+            try:
+                response = self.session.get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries:
+                    raise e
+                delay = self.backoff(attempt)
+                logging.debug(f'Request to {host} failed ({repr(e)}), retrying in {delay:.1f}s.')
+            else:
+                rate_limit_delay = self.updateRateLimit(host, response)
+                if response.status_code not in HTTP_RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    if not kwargs.get('stream'):
+                        self.countBytes(len(response.content))
+                    return response
+                response.close()
+                delay = 0 if rate_limit_delay is not None else self.backoff(attempt)
+                logging.debug(f'{host} responded with {response.status_code}, retrying.')
+            with self.lock:
+                self.retry_count += 1
+            time.sleep(delay)
+    
+    def countBytes(self, size: int) -> None:
+        with self.lock:
+            self.bytes_received += size
+    
+    def logStats(self) -> None:
+        logging.info(f'HTTP: {self.request_count} request(s), {self.retry_count} retries, {self.bytes_received} bytes received, {self.rate_limit_wait:.1f}s waiting on rate limits.')
+
+http_client: HTTPClient | None = None
+
+def getHTTPClient() -> HTTPClient:
+    global http_client
+    if http_client is None:
+        http_client = HTTPClient()
+    return http_client
+
+def setupHTTPClient(config: Config, offline: bool = False) -> HTTPClient:
+    global http_client
+    logging.debug(f'Setting up HTTP client')
+    http_client = HTTPClient(max(config['Max Download Workers'], 1) + 2, config['HTTP Max Retries'], offline)
+    return http_client
+
+def downloadFile(url: str, path: str, headers: dict | None = None, hashes: dict[str, str] | None = None) -> None:
+    """Streams url into path through a resumable .part file, verifying it before atomically moving it into place."""
+    logging.debug(f'Downloading "{url}" into "{path}".')
+    hashes = hashes or {}
+    algorithm = pickHashAlgorithm(hashes)
+    part_path = f'{path}.part'
+    
+    for attempt in range(2):
+        request_headers = dict(headers or {})
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if offset > 0:
+            request_headers['Range'] = f'bytes={offset}-'
+        with getHTTPClient().get(url, headers = request_headers, stream = True, timeout = DOWNLOAD_TIMEOUT) as response:
+            if response.status_code == 416 and offset > 0:
+                logging.debug(f'"{part_path}" is already complete.')
+            else:
+                response.raise_for_status()
+                if response.status_code == 206:
+                    logging.info(f'Resuming download of "{os.path.basename(path)}" from {offset} bytes.')
+                    mode = 'ab'
+                else:
+                    mode = 'wb'
+                with open(part_path, mode) as f:
+                    for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+                        getHTTPClient().countBytes(len(chunk))
+        
+        if algorithm is not None:
+            logging.debug(f'Hashing "{part_path}" with {algorithm}.')
+            valid = hashFile(part_path, algorithm) == hashes[algorithm].lower()
+        else:
+            valid = not checkIfZipIsCorrupted(part_path)
+        if valid:
+            break
+        os.remove(part_path)
+        if offset == 0 or attempt > 0:
+            raise ValueError(f'The downloaded file "{os.path.basename(path)}" does not match its expected hash.')
+        logging.warning(f'The resumed download of "{os.path.basename(path)}" was invalid, restarting it.')
+    
+    os.replace(part_path, path)
+    markFileVerified(path, hashes)
+    logging.debug(f'Done downloading "{url}".')
+
+def storeFile(key: ModKey, url: str, headers: dict | None, file_name: str, hashes: dict[str, str], legacy_path: str | None = None) -> str:
+    """Makes sure the file a mod resolved to is in the download store, downloading it if needed, and returns its path."""
+    blob = hashes.get('sha1', '').lower() or None
+    if blob is None:
+        blob = download_store.lookup(key, file_name)
+    
+    if blob is not None:
+        blob_path = download_store.blobPath(blob)
+        with download_store.lock(blob):
+            if os.path.isfile(blob_path) and verifyFile(blob_path, hashes):
+                logging.debug(f'"{file_name}" is already in the download store.')
+                download_store.record(key, file_name, blob)
+                return blob_path
+            os.makedirs(os.path.dirname(blob_path), exist_ok = True)
+            if legacy_path is not None and os.path.isfile(legacy_path) and verifyFile(legacy_path, hashes):
+                os.replace(legacy_path, blob_path)
+                markFileVerified(blob_path, hashes)
+                logging.info(f'Moved "{legacy_path}" into the download store')
+            else:
+                downloadFile(url, blob_path, headers, hashes)
+                logging.info(f'Downloaded "{file_name}" into the download store')
+    else:
+        incoming_path = os.path.join(download_store.root, 'incoming', file_name)
+        with download_store.lock(f'incoming/{file_name}'):
+            os.makedirs(os.path.dirname(incoming_path), exist_ok = True)
+            downloadFile(url, incoming_path, headers, hashes)
+            logging.debug(f'Hashing "{incoming_path}" with sha1.')
+            blob = hashFile(incoming_path, 'sha1')
+            blob_path = download_store.blobPath(blob)
+            with download_store.lock(blob):
+                os.makedirs(os.path.dirname(blob_path), exist_ok = True)
+                os.replace(incoming_path, blob_path)
+        logging.info(f'Downloaded "{file_name}" into the download store')
+    
+    download_store.record(key, file_name, blob)
+    return blob_path
 
-def checkForUpdate() -> bool | None:
+def getJSON(url: str, params: dict | None = None, headers: dict | None = None, kind: str | None = None) -> typing.Any:
+    """GETs a JSON document, going through the metadata cache when a cache kind is given."""
+    key = f'{url}?{urllib.parse.urlencode(sorted((params or {}).items()))}'
+    cache = metadata_cache if kind is not None else None
+    cached = cache.lookup(key) if cache is not None else None
+    if cached is not None and cache.isFresh(kind, cached[3]):
+        cache.count(hits = 1)
+        return json.loads(cached[0])
+    
+    request_headers = dict(headers or {})
+    if cached is not None:
+        if cached[1] is not None: request_headers['If-None-Match'] = cached[1]
+        if cached[2] is not None: request_headers['If-Modified-Since'] = cached[2]
+    try:
+        response = getHTTPClient().get(url, params = params, headers = request_headers)
+        if response.status_code == 304 and cached is not None:
+            logging.debug(f'Metadata for "{url}" has not changed.')
+            cache.count(revalidations = 1)
+            cache.refresh(key)
+            return json.loads(cached[0])
+        response.raise_for_status()
+    except Exception as e:
+        if cached is None or isinstance(e, OfflineError):
+            raise e
+        logging.warning(f'Could not refresh metadata for "{url}", using the cached copy: {repr(e)}')
+        cache.count(hits = 1)
+        return json.loads(cached[0])
+    
+    if cache is not None:
+        cache.count(misses = 1)
+        cache.put(key, kind, response.text, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+    return response.json()
+
+def checkForUpdate() -> str | None:
+    """Returns the latest RMMUD release if it is newer than this version. The answer is cached like any other
+    GitHub response, for as long as the GitHub metadata cache TTL."""
     logging.info('Checking for an RMMUD update.')
     
     def getGithubLatestReleaseTag(tags_url: str = "https://api.github.com/repos/RandomGgames/RMMUD/tags") -> str:
         logging.debug('Getting latest github release version.')
         try:
-            release_version: str = requests.get(tags_url).json()[0]["name"]
+            release_version: str = getJSON(tags_url, kind = 'GitHub')[0]["name"]
             logging.debug(f'Done getting latest github release version ({release_version}).')
             return release_version
         except Exception as e:
@@ -126,19 +976,45 @@ def checkForUpdate() -> bool | None:
     version_check = compareTwoVersions(github_version, __version__)
     match version_check:
         case "higher":
-            logging.info(f'There is an update available! ({current_version} (current) → {github_version} (latest)).\nDo you want to open the GitHub releases page to download it right now? (yes/no): ')
-            open_update = input('Open releases page? ').lower()
-            if open_update in ("yes", "y"):
-                url = "https://github.com/RandomGgames/RMMUD/releases"
-                webbrowser.open(url)
-                exit()
+            logging.info(f'There is an update available! ({current_version} (current) → {github_version} (latest)). Get it from https://github.com/RandomGgames/RMMUD/releases')
+            return github_version
         case "lower":
             logging.info(f'You are on what seems like a work in progress version, as it is higher than the latest release. Please report any bugs onto the github page at https://github.com/RandomGgames/RMMUD')
-            return False
+            return None
         case "same":
             logging.info(f'You are on the latest version already.')
             return None
 
+def startUpdateCheck() -> concurrent.futures.Future:
+    """Runs checkForUpdate on a background thread so the run does not wait on GitHub."""
+    future: concurrent.futures.Future = concurrent.futures.Future()
+    def check() -> None:
+        try:
+            future.set_result(checkForUpdate())
+        except Exception as e:
+            future.set_exception(e)
+    threading.Thread(target = check, name = 'RMMUD update check', daemon = True).start()
+    return future
+
+def finishUpdateCheck(update_check: concurrent.futures.Future) -> None:
+    """Waits briefly for the background update check and, when run from a terminal, offers to open the releases page.
+    Never prompts when nobody is there to answer (scheduled tasks, cron, services)."""
+    try:
+        latest_version = update_check.result(timeout = UPDATE_CHECK_WAIT)
+    except concurrent.futures.TimeoutError:
+        logging.debug(f'The update check did not finish within {UPDATE_CHECK_WAIT}s, skipping it.')
+        return
+    except Exception as e:
+        logging.warning(f'Could not check for updates due to {repr(e)}... Update checks will have to be done manually due to the current or latest version tag.')
+        return
+    if latest_version is None or not sys.stdin.isatty():
+        return
+    logging.info(f'Do you want to open the GitHub releases page to download RMMUD {latest_version} right now? (yes/no): ')
+    open_update = input('Open releases page? ').lower()
+    if open_update in ("yes", "y"):
+        import webbrowser
+        webbrowser.open("https://github.com/RandomGgames/RMMUD/releases")
+
 def copyToFolders(file_path: str, destination_path: str) -> None:
     logging.debug(f'Copying "{file_path}" into "{destination_path}".')
     try:
@@ -150,6 +1026,42 @@ def copyToFolders(file_path: str, destination_path: str) -> None:
         logging.exception(e)
         raise e
 
+def reflinkFile(source_path: str, destination_path: str) -> None:
+    """Clones source_path into destination_path sharing the same data blocks (Btrfs, XFS, ...). Linux only."""
+    if not sys.platform.startswith('linux'):
+        raise OSError(f'Reflinks are not supported on {sys.platform}.')
+    import fcntl
+    with open(source_path, 'rb') as source, open(destination_path, 'wb') as destination:
+        fcntl.ioctl(destination.fileno(), FICLONE, source.fileno())
+
+def deployFile(source_path: str, destination_path: str, mode: str = 'copy') -> str:
+    """Places source_path at destination_path with the given deployment mode, falling back to a copy. Returns the mode actually used."""
+    logging.debug(f'Deploying "{source_path}" into "{destination_path}" ({mode}).')
+    temp_path = f'{destination_path}.rmmud-tmp'
+    if os.path.lexists(temp_path):
+        os.remove(temp_path)
+    try:
+        match mode:
+            case 'hardlink':
+                os.link(source_path, temp_path)
+            case 'symlink':
+                os.symlink(os.path.abspath(source_path), temp_path)
+            case 'reflink':
+                reflinkFile(source_path, temp_path)
+            case _:
+                mode = 'copy'
+                shutil.copyfile(source_path, temp_path)
+    except OSError as e:
+        if mode == 'copy':
+            raise e
+        logging.debug(f'Could not {mode} "{source_path}", copying it instead: {repr(e)}')
+        if os.path.lexists(temp_path):
+            os.remove(temp_path)
+        mode = 'copy'
+        shutil.copyfile(source_path, temp_path)
+    os.replace(temp_path, destination_path)
+    return mode
+
 def loadConfigFile(path: str = "RMMUDConfig.yaml") -> Config:
     logging.info(f'Loading config.')
     
@@ -169,10 +1081,26 @@ def loadConfigFile(path: str = "RMMUDConfig.yaml") -> Config:
     if config['CurseForge API Key'] is not None and not isinstance(config['CurseForge API Key'], str):
         raise TypeError("Curseforge API key should be a string or None.")
     
+    config['Run Report File'] = config.get('Run Report File', None)
+    if config['Run Report File'] is not None and not isinstance(config['Run Report File'], str):
+        raise TypeError("Run Report File should be a string or None.")
+    
     defaults = {
         "Check for RMMUD Updates": True,
         "Downloads Folder": "RMMUDDownloads",
-        "Instances Folder": "RMMUDInstances"
+        "Instances Folder": "RMMUDInstances",
+        "Max Download Workers": 8,
+        "Modrinth API URL": MODRINTH_API_URL,
+        "CurseForge API URL": CURSEFORGE_API_URL,
+        "Metadata Cache TTLs": dict(METADATA_CACHE_TTLS),
+        "Metadata Cache Max Entries": 20000,
+        "HTTP Max Retries": 5,
+        "Deployment Mode": "copy",
+        "Lockfile Max Age": 3600,
+        "Download Dependencies": True,
+        "Max Scan Workers": os.cpu_count() or 1,
+        "Watch Interval": 5,
+        "Upstream Poll Interval": 3600
     }
     
     for key, value in defaults.items():
@@ -180,11 +1108,38 @@ def loadConfigFile(path: str = "RMMUDConfig.yaml") -> Config:
         if not isinstance(config[key], type(value)):
             raise TypeError(f"{key} should be a {type(value).__name__}.")
     
+    if config['Max Download Workers'] < 1:
+        raise ValueError("Max Download Workers should be at least 1.")
+    if config['Max Scan Workers'] < 1:
+        raise ValueError("Max Scan Workers should be at least 1.")
+    if config['HTTP Max Retries'] < 0:
+        raise ValueError("HTTP Max Retries should be at least 0.")
+    if config['Watch Interval'] < 1 or config['Upstream Poll Interval'] < 1:
+        raise ValueError("Watch Interval and Upstream Poll Interval should be at least 1 second.")
+    config['Modrinth API URL'] = config['Modrinth API URL'].rstrip('/')
+    config['CurseForge API URL'] = config['CurseForge API URL'].rstrip('/')
+    config['Deployment Mode'] = config['Deployment Mode'].lower()
+    if config['Deployment Mode'] not in DEPLOYMENT_MODES:
+        raise ValueError(f"Deployment Mode should be one of {', '.join(DEPLOYMENT_MODES)}.")
+    config['Metadata Cache TTLs'] = {**METADATA_CACHE_TTLS, **config['Metadata Cache TTLs']}
+    for kind, ttl in config['Metadata Cache TTLs'].items():
+        if ttl is not None and not isinstance(ttl, int):
+            raise TypeError(f"The {kind} metadata cache TTL should be a number of seconds or null.")
+    
     logging.debug(f'Done verifying config variable types.')
     
     logging.debug(f'Done loading config.')
     return config
 
+def parseYAMLFile(path: str) -> tuple[typing.Any, str | None]:
+    """Returns the data in a YAML file and None, or None and why it could not be read. Does not log so it can run in a worker process."""
+    import yaml
+    try:
+        with open(path, 'r') as f:
+            return yaml.load(f, yamlLoader()), None
+    except Exception as e:
+        return None, repr(e)
+
 def loadInstanceFile(path: str) -> Instance:
     logging.debug(f'Reading instance file "{path}".')
     
@@ -195,6 +1150,13 @@ def loadInstanceFile(path: str) -> Instance:
         logging.exception(e)
         raise e
     
+    return verifyInstance(path, data)
+
+def verifyInstance(path: str, data: typing.Any) -> Instance:
+    """Checks the data read from an instance file and fills in the defaults."""
+    if not isinstance(data, dict):
+        raise TypeError(f"The instance file {path} should hold a mapping of options.")
+    
     logging.debug(f'Verifying instance variable types.')
     
     defaults = {
@@ -202,7 +1164,9 @@ def loadInstanceFile(path: str) -> Instance:
         "Loader": "",
         "Directory": ["", None],
         "Mods": [None, "", [...], {...: ...}],
-        "Version": ""
+        "Version": "",
+        "Release Channel": "release",
+        "World": "world"
     }
     
     for key, value in defaults.items():
@@ -219,11 +1183,16 @@ def loadInstanceFile(path: str) -> Instance:
     logging.debug(f'Done verifying instance variable types.')
     
     data["Loader"] = data["Loader"].lower()
+    data["Release Channel"] = data["Release Channel"].lower()
+    if data["Release Channel"] not in RELEASE_CHANNELS:
+        raise ValueError(f"The Release Channel option in the instance file {path} should be one of {', '.join(RELEASE_CHANNELS)}.")
     
     logging.debug(f'Done reading instance file')
     return data
 
-def loadInstances(instances_dir: str) -> Instances:
+def loadInstances(instances_dir: str, max_workers: int = 8) -> Instances:
+    """Loads every enabled instance file. Files that have not changed since they were last validated come from the
+    instance cache, the rest are parsed on a process pool (in-process when there are only a few), as parsing YAML holds the GIL."""
     logging.info(f'LOADING INSTANCES')
     
     if not os.path.exists(instances_dir):
@@ -235,302 +1204,1117 @@ def loadInstances(instances_dir: str) -> Instances:
             logging.exception(e)
             raise e
     
-    enabled_instances: Instances = {}
-    for instance_file in [f for f in os.listdir(instances_dir) if f.endswith('.yaml')]:
-        instance_path = os.path.join(instances_dir, instance_file)
-        instance_name = os.path.splitext(instance_file)[0]
+    def tryVerifyInstance(instance_file: str, data: typing.Any, error: str | None) -> Instance | None:
         try:
-            instance = loadInstanceFile(instance_path)
-            if not instance['Enabled']:
-                logging.info(f'Ignoring disabled instance "{instance_file}"')
-                continue
-            else:
-                logging.info(f'Loading enabled instance "{instance_file}"')
-                instance.pop('Enabled')
-                enabled_instances[instance_name] = instance
+            if error is not None:
+                raise ValueError(f'Could not read the YAML file: {error}')
+            return verifyInstance(os.path.join(instances_dir, instance_file), data)
         except Exception as e:
-            logging.warning(f'Could not load instance "{instance_name}". Ignoring this file.')
+            logging.warning(f'Could not load instance "{os.path.splitext(instance_file)[0]}". Ignoring this file.')
             logging.exception(e)
+            return None
+    
+    indexed = instance_cache.load(instances_dir) if instance_cache is not None else {}
+    entries: dict[str, tuple[int, int, str]] = {}
+    loaded: dict[str, Instance | None] = {}
+    unindexed: list[tuple[str, os.stat_result]] = []
+    for instance_file in sorted(f for f in os.listdir(instances_dir) if f.endswith('.yaml')):
+        stat = os.stat(os.path.join(instances_dir, instance_file))
+        entry = indexed.get(instance_file)
+        if entry is not None and entry[:2] == (stat.st_size, stat.st_mtime_ns):
+            loaded[instance_file] = json.loads(entry[2])
+            entries[instance_file] = entry
+        else:
+            loaded[instance_file] = None
+            unindexed.append((instance_file, stat))
+    logging.debug(f'{len(loaded) - len(unindexed)} instance file(s) unchanged, reading {len(unindexed)} instance file(s)')
+    
+    parsed = runProcessJobs(parseYAMLFile, [(os.path.join(instances_dir, instance_file),) for instance_file, _ in unindexed], max_workers)
+    for (instance_file, stat), (data, error) in zip(unindexed, parsed):
+        instance = loaded[instance_file] = tryVerifyInstance(instance_file, data, error)
+        if instance is None:
+            continue
+        try:
+            entries[instance_file] = (stat.st_size, stat.st_mtime_ns, json.dumps(instance))
+        except (TypeError, ValueError) as e:
+            logging.debug(f'Not caching instance "{os.path.splitext(instance_file)[0]}", it holds values that cannot be cached: {repr(e)}')
+    if instance_cache is not None:
+        instance_cache.save(instances_dir, entries)
+    
+    enabled_instances: Instances = {}
+    for instance_file, instance in loaded.items():
+        if instance is None:
             continue
+        if not instance['Enabled']:
+            logging.info(f'Ignoring disabled instance "{instance_file}"')
+            continue
+        logging.info(f'Loading enabled instance "{instance_file}"')
+        instance.pop('Enabled')
+        enabled_instances[os.path.splitext(instance_file)[0]] = instance
     return enabled_instances
 
-def parseInstances(instances: Instances) -> ParsedInstances:
+@functools.lru_cache(maxsize = None)
+def parseModURL(mod_url: str) -> tuple[str, str, str, str | None] | None:
+    """Returns the (website, project type, mod id, pinned mod version or None) a mod URL points to, or None if it cannot be handled.
+    Memoized, as the same URLs tend to appear in many instances."""
+    parsed_url = urlparse(mod_url)
+    url_authority = parsed_url.netloc
+    mod_version = None
+    if url_authority == "": return None # Probably a disabled mod just ignore it.
+    url_authority = url_authority.lstrip('www.')
+    url_path_split = parsed_url.path.split('/')[1:]
+    
+    if url_authority == 'modrinth.com':
+        if url_path_split[0] not in MODRINTH_PROJECT_TYPES:
+            return None
+        
+        project_type = MODRINTH_PROJECT_TYPES[url_path_split[0]]
+        mod_id = url_path_split[1]
+        
+        if len(url_path_split) == 4 and url_path_split[2] == 'version':
+            mod_version = url_path_split[3]
+    
+    elif url_authority == 'curseforge.com':
+        if url_path_split[0] != 'minecraft' or url_path_split[1] not in CURSEFORGE_PROJECT_TYPES:
+            logging.warning(f'Url "{mod_url}" is not for a minecraft mod, resource pack, shader pack or datapack!')
+            return None
+        
+        project_type = CURSEFORGE_PROJECT_TYPES[url_path_split[1]]
+        mod_id = url_path_split[2]
+        
+        if len(url_path_split) == 5 and url_path_split[3] == 'files':
+            mod_version = url_path_split[4]
+    
+    else: # Unsupported website
+        logging.warning(f'Mod manager cannot handle URLs from "{url_authority}". {mod_url}')
+        return None
+    
+    return url_authority, project_type, mod_id, mod_version
+
+def parseInstances(instances: Instances) -> ModJobs:
     logging.debug('Parsing enabled instances')
-    parsed_instances: ParsedInstances = {}
+    jobs: ModJobs = {}
     
     for instance_name, instance in instances.items():
         mod_loader = str(instance['Loader']).lower()
         minecraft_version = str(instance['Version'])
         instance_dir = str(instance['Directory'])
+        latest_version = latestVersion(instance.get('Release Channel', 'release'))
         mods = extractNestedStrings(instance['Mods'])
         
         for mod_url in mods:
-            url_authority = urlparse(mod_url).netloc
-            mod_version = 'latest_version'
-            if url_authority == "": continue # Probably a disabled mod just ignore it.
-            url_authority = url_authority.lstrip('www.')
-            
-            if url_authority == 'modrinth.com':
-                url_path = urlparse(mod_url).path
-                url_path_split = url_path.split('/')[1:]
-                
-                if url_path_split[0] not in ('mod', 'plugin', 'datapack'):
-                    continue
-                
-                mod_id = url_path_split[1]
-                
-                if len(url_path_split) == 4 and url_path_split[2] == 'version':
-                    mod_version = url_path_split[3]
-            
-            elif url_authority == 'curseforge.com':
-                url_path = urlparse(mod_url).path
-                url_path_split = url_path.split('/')[1:]
-                
-                if url_path_split[0] != 'minecraft' or url_path_split[1] != 'mc-mods':
-                    logging.warning(f'Url "{mod_url}" is not for a minecraft mod!')
-                    continue
-                
-                mod_id = url_path_split[2]
-                
-                if len(url_path_split) == 5 and url_path_split[3] == 'files':
-                    mod_version = url_path_split[4]
-            
-            else: # Unsupported website
-                logging.warning(f'Mod manager cannot handle URLs from "{url_authority}". {mod_url}')
+            parsed_url = parseModURL(mod_url)
+            if parsed_url is None:
                 continue
+            url_authority, project_type, mod_id, mod_version = parsed_url
+            mod_version = mod_version or latest_version
+            if project_type == 'shader':
+                project_type = SHADER_LOADERS.get(mod_loader, 'shader-optifine')
             
-            parsed_instances.setdefault(mod_loader, {}).setdefault('mods', {}).setdefault(minecraft_version, {}).setdefault(mod_id, {}).setdefault(url_authority, {}).setdefault(mod_version, {}).setdefault('directories', [])
-            
-            if instance_dir not in parsed_instances[mod_loader]['mods'][minecraft_version][mod_id][url_authority][mod_version]['directories']:
-                parsed_instances[mod_loader]['mods'][minecraft_version][mod_id][url_authority][mod_version]['directories'].append(instance_dir)
+            key = ModKey(url_authority, mod_id, project_type if project_type in PACK_FOLDERS else mod_loader, minecraft_version, mod_version)
+            job = jobs.get(key)
+            if job is None:
+                job = jobs[key] = ModJob(key)
+            job.directories.add(instance_dir)
+            job.instances.add(instance_name)
     
-    return parsed_instances
+    return jobs
+
+def latestVersion(channel: str) -> str:
+    """The mod version of a mod that is not pinned: the newest version on the given release channel."""
+    return f'latest_{channel}'
+
+def isLatestVersion(mod_version: str) -> bool:
+    return mod_version.startswith('latest_')
+
+def publishedKey(date: str) -> str:
+    """Turns an RFC 3339 UTC timestamp into a string that sorts chronologically, without parsing it."""
+    date = date.rstrip('Z')
+    if '.' not in date:
+        date += '.'
+    return date.ljust(26, '0')
+
+def selectVersion(versions: typing.Iterable[dict], channel_of: typing.Callable[[dict], str], date_of: typing.Callable[[dict], str], channel: str = 'release') -> dict | None:
+    """Picks the newest version on the given release channel or a more stable one, in a single pass.
+    If there is none, the newest version of the most stable channel that has one is picked instead."""
+    allowed_rank = RELEASE_CHANNELS.index(channel)
+    best_version = None
+    best_key = None
+    for version in versions:
+        version_channel = channel_of(version)
+        rank = RELEASE_CHANNELS.index(version_channel) if version_channel in RELEASE_CHANNELS else len(RELEASE_CHANNELS)
+        key = (rank <= allowed_rank, 0 if rank <= allowed_rank else -rank, publishedKey(date_of(version)))
+        if best_key is None or key > best_key:
+            best_version, best_key = version, key
+    return best_version
 
-def downloadModrinthMod(mod_id: str, mod_loader: str, minecraft_version: str, mod_version: str,
-                        download_dir: str, instance_dirs: list[str]) -> None:
-    logging.info(f'Updating {mod_id} for {mod_loader} {minecraft_version}')
+def indexModrinthVersions(versions: list[dict]) -> dict[str, list[dict]]:
+    """Indexes a project's versions by version number and by version ID, for pinned lookups."""
+    index: dict[str, list[dict]] = {}
+    for version in versions:
+        index.setdefault(version['version_number'], []).append(version)
+        index.setdefault(version['id'], []).append(version)
+    return index
+
+def getCurseforgeFiles(url: str, params: dict, headers: dict) -> list[dict]:
+    """Gets every page of a CurseForge files listing."""
+    files: list[dict] = []
+    while True:
+        response = getJSON(url, {**params, 'index': len(files), 'pageSize': CURSEFORGE_FILES_PAGE_SIZE}, headers, 'CurseForge')
+        files.extend(response['data'])
+        total_count = response.get('pagination', {}).get('totalCount', 0)
+        if not response['data'] or len(files) >= total_count or len(files) + CURSEFORGE_FILES_PAGE_SIZE > CURSEFORGE_MAX_RESULTS:
+            return files
+
+def resolveModrinthProjects(mod_ids: list[str], api_url: str = MODRINTH_API_URL) -> dict[str, list[dict]]:
+    logging.info(f'Resolving {len(set(mod_ids))} Modrinth project(s)')
+    batch_count = 0
     
-    logging.debug(f'Getting files from Modrinth')
-    base_url = (f'https://api.modrinth.com/v2/project/{mod_id}/version')
-    if mod_version == 'latest_version':
-        params = {'loaders': [mod_loader], 'game_versions': [minecraft_version]}
-    else:
-        params = {'loaders': [mod_loader]}
-    url = f'{base_url}?{"&".join([f"{key}={json.dumps(value)}" for key, value in params.items()])}'
-    try:
-        modrinth_header = {'User-Agent': 'RandomGgames/RMMUD (randomggamesofficial@gmail.com)'}
-        response = requests.get(url, headers = modrinth_header).json()
-    except Exception as e:
-        logging.warning(f'Could not update "{mod_id}": {e}')
-        return
-    response = sorted(response, key=lambda x: datetime.fromisoformat(x['date_published'][:-1]), reverse = True)
-    if mod_version == 'latest_version':
-        if len(response) > 0:
-            desired_mod_version = response[0]
+    logging.debug(f'Getting projects from Modrinth')
+    projects: dict[str, dict] = {}
+    stale_projects: dict[str, dict] = {}
+    missing_project_ids: list[str] = []
+    for mod_id in sorted(set(mod_ids)):
+        # Each project is cached on its own, under its ID and slug, so any subset of projects can be resolved from the cache
+        row = None
+        if metadata_cache is not None:
+            row = metadata_cache.lookup(f'{api_url}/project/{mod_id}') or metadata_cache.lookup(f'{api_url}/project/{mod_id.lower()}')
+        if row is not None and metadata_cache.isFresh('Modrinth', row[3]):
+            projects[mod_id] = json.loads(row[0])
         else:
-            logging.warning(f'Could not find "{mod_id}" for {mod_loader} {minecraft_version}. https://modrinth.com/mod/{mod_id}')
-            return
-    else:
-        if len(response) > 0:
-            desired_mod_version = [version for version in response if version['version_number'] == mod_version][0]
-        else:
-            logging.warning(f'Could not find "{mod_id} {mod_version}" for {mod_loader} {minecraft_version}')
-            return
-    desired_mod_version_files = desired_mod_version['files']
-    if any(file['primary'] == True in file for file in desired_mod_version_files):
-        desired_mod_version_files = [file for file in desired_mod_version_files if file['primary'] == True]
-    desired_mod_version_file = desired_mod_version_files[0]
-    
-    logging.debug(f'Downloading desired version from Modrinth')
-    download_url = desired_mod_version_file['url']
-    file_name = desired_mod_version_file['filename']
-    download_path = os.path.join(download_dir, mod_loader, minecraft_version)
-    downloaded_file_path = os.path.join(download_path, file_name)
-    
-    if not os.path.exists(downloaded_file_path) or checkIfZipIsCorrupted(downloaded_file_path):
+            if row is not None:
+                stale_projects[mod_id] = json.loads(row[0])
+            missing_project_ids.append(mod_id)
+    if metadata_cache is not None:
+        metadata_cache.count(hits = -(-len(projects) // MODRINTH_PROJECTS_PER_REQUEST), misses = -(-len(missing_project_ids) // MODRINTH_PROJECTS_PER_REQUEST))
+    for chunk in chunked(missing_project_ids, MODRINTH_PROJECTS_PER_REQUEST):
         try:
-            response = requests.get(download_url, headers = modrinth_header)
+            batch_count += 1
+            for project in getJSON(f'{api_url}/projects', {'ids': json.dumps(chunk)}, MODRINTH_HEADERS):
+                projects[project['id']] = project
+                projects[project['slug'].lower()] = project
+                if metadata_cache is not None:
+                    for name in (project['id'], project['slug'].lower()):
+                        metadata_cache.put(f'{api_url}/project/{name}', 'Modrinth', json.dumps(project))
         except Exception as e:
-            logging.warning(f'Could not download "{mod_id}": {e}')
-            return
+            logging.warning(f'Could not get Modrinth projects {", ".join(chunk)}, using any cached copies: {repr(e)}')
+            projects.update((mod_id, stale_projects[mod_id]) for mod_id in chunk if mod_id in stale_projects)
+    
+    logging.debug(f'Getting versions from Modrinth')
+    versions: dict[str, dict] = {}
+    missing_version_ids: list[str] = []
+    for version_id in sorted({version_id for project in projects.values() for version_id in project['versions']}):
+        version = metadata_cache.get(f'{api_url}/version/{version_id}', 'Modrinth Versions') if metadata_cache is not None else None
+        if version is not None:
+            versions[version_id] = version
+        else:
+            missing_version_ids.append(version_id)
+    if metadata_cache is not None: # Counted per bulk request the versions stand for
+        metadata_cache.count(hits = -(-len(versions) // MODRINTH_VERSIONS_PER_REQUEST), misses = -(-len(missing_version_ids) // MODRINTH_VERSIONS_PER_REQUEST))
+    for chunk in chunked(missing_version_ids, MODRINTH_VERSIONS_PER_REQUEST):
         try:
-            with open(downloaded_file_path, 'wb') as f: f.write(response.content)
+            batch_count += 1
+            for version in getJSON(f'{api_url}/versions', {'ids': json.dumps(chunk)}, MODRINTH_HEADERS):
+                versions[version['id']] = version
+                if metadata_cache is not None:
+                    metadata_cache.put(f'{api_url}/version/{version["id"]}', 'Modrinth Versions', json.dumps(version))
         except Exception as e:
-            logging.warning(f'Could not save file "{file_name}" to "{download_path}": {e}')
-            return
-        logging.info(f'Downloaded "{file_name}" into "{download_path}"')
+            logging.warning(f'Could not get {len(chunk)} Modrinth versions: {repr(e)}')
     
-    logging.debug(f'Copying downloaded file into instance(s)')
-    for instance_dir in instance_dirs:
-        instance_dir = os.path.join(instance_dir, 'mods')
-        instance_file_path = os.path.join(instance_dir, file_name)
-        if os.path.exists(instance_dir):
-            if os.path.exists(downloaded_file_path):
-                if not os.path.isfile(instance_file_path) or checkIfZipIsCorrupted(instance_file_path):
-                    try:
-                        shutil.copy(downloaded_file_path, instance_file_path)
-                        logging.info(f'Copied "{downloaded_file_path}" into "{instance_dir}"')
-                    except Exception as e:
-                        logging.warning(f'Could not copy "{downloaded_file_path}" into "{instance_dir}": {e}')
-                        continue
-            else:
-                logging.warning(f'Could not copy "{downloaded_file_path}" into "{instance_dir}": Could not find "{downloaded_file_path}"')
-        else:
-            logging.warning(f'Could not copy "{downloaded_file_path}" into "{instance_dir}": Could not find "{instance_dir}"')
+    resolved: dict[str, list[dict]] = {}
+    for mod_id in mod_ids:
+        project = projects.get(mod_id, projects.get(mod_id.lower()))
+        if project is None:
+            logging.warning(f'Could not find "{mod_id}" on Modrinth. https://modrinth.com/mod/{mod_id}')
+            continue
+        if not all(version_id in versions for version_id in project['versions']):
+            logging.warning(f'Could not get every version of "{mod_id}" from Modrinth.')
+            continue
+        resolved[mod_id] = [versions[version_id] for version_id in project['versions']]
+    
+    logging.info(f'Resolved {len(resolved)}/{len(set(mod_ids))} Modrinth project(s) in {batch_count} batch(es)')
+    return resolved
 
-def downloadCurseforgeMod(mod_id: str, mod_loader: str, minecraft_version: str, mod_version: str, download_dir: str, instance_dirs: list[str], curseforge_api_key: str) -> None:
-    logging.info(f'Updating {mod_id} for {mod_loader} {minecraft_version}')
+def resolveModrinthFile(mod_id: str, mod_loader: str, minecraft_version: str, mod_version: str, versions: list[dict] | None,
+                        version_index: dict[str, list[dict]] | None = None) -> ResolvedFile | None:
+    logging.debug(f'Resolving {mod_id} for {mod_loader} {minecraft_version}')
+    
+    if versions is None:
+        logging.warning(f'Could not update "{mod_id}": It could not be resolved on Modrinth. https://modrinth.com/mod/{mod_id}')
+        return None
+    
+    logging.debug(f'Selecting Modrinth version')
+    loaders = PACK_LOADERS.get(mod_loader, (mod_loader,))
+    if isLatestVersion(mod_version):
+        candidates = (version for version in versions if any(loader in version['loaders'] for loader in loaders) and minecraft_version in version['game_versions'])
+        desired_mod_version = selectVersion(candidates, lambda version: version.get('version_type', 'release'), lambda version: version['date_published'], mod_version.removeprefix('latest_'))
+        if desired_mod_version is None:
+            logging.warning(f'Could not find "{mod_id}" for {mod_loader} {minecraft_version}. https://modrinth.com/mod/{mod_id}')
+            return None
+    else:
+        version_index = version_index if version_index is not None else indexModrinthVersions(versions)
+        candidates = (version for version in version_index.get(mod_version, []) if any(loader in version['loaders'] for loader in loaders))
+        desired_mod_version = selectVersion(candidates, lambda version: version.get('version_type', 'release'), lambda version: version['date_published'], 'alpha')
+        if desired_mod_version is None:
+            logging.warning(f'Could not find "{mod_id} {mod_version}" for {mod_loader} {minecraft_version}')
+            return None
+    desired_mod_version_files = [file for file in desired_mod_version['files'] if file.get('primary')] or desired_mod_version['files']
+    desired_mod_version_file = desired_mod_version_files[0]
+    
+    return {
+        'site': 'modrinth.com', 'project': mod_id, 'loader': mod_loader, 'game_version': minecraft_version, 'mod_version': mod_version,
+        'version_id': desired_mod_version['id'],
+        'file_name': desired_mod_version_file['filename'],
+        'url': desired_mod_version_file['url'],
+        'hashes': desired_mod_version_file.get('hashes', {}),
+        'project_id': desired_mod_version['project_id'],
+        'dependencies': [{'project': dependency['project_id'], 'type': dependency['dependency_type']} for dependency in desired_mod_version.get('dependencies', [])
+                         if dependency.get('project_id') and dependency.get('dependency_type') in ('required', 'incompatible')]
+    }
+
+def resolveCurseforgeFile(mod_id: str, mod_loader: str, minecraft_version: str, mod_version: str, curseforge_api_key: str, api_url: str = CURSEFORGE_API_URL) -> ResolvedFile | None:
+    logging.debug(f'Resolving {mod_id} for {mod_loader} {minecraft_version}')
     
     # Getting mod ID
     logging.debug(f'Getting mod ID from CurseForge')
-    url = 'https://api.curseforge.com/v1/mods/search'
-    params = {'gameId': '432','slug': mod_id, 'classId': '6'}
-    curseforge_header = {'Accept': 'application/json','x-api-key': curseforge_api_key}
-    try:
-        response = requests.get(url, params, headers = curseforge_header).json()['data']
-        curseforge_mod_id = response[0]['id']
-    except Exception as e:
-        logging.warning(f'Could not fetch CurseForge ID for "{mod_id}": {repr(e)}')
-        return
+    url = f'{api_url}/mods/search'
+    params = {'gameId': '432','slug': mod_id, 'classId': str(CURSEFORGE_CLASS_IDS.get(mod_loader, CURSEFORGE_CLASS_IDS['mod']))}
+    curseforge_header = siteHeaders('curseforge.com', curseforge_api_key)
+    if mod_id.isdigit(): # Dependencies are referenced by mod ID rather than slug
+        curseforge_mod_id = int(mod_id)
+    else:
+        try:
+            response = getJSON(url, params, curseforge_header, 'CurseForge IDs')['data']
+            curseforge_mod_id = response[0]['id']
+        except Exception as e:
+            logging.warning(f'Could not fetch CurseForge ID for "{mod_id}": {repr(e)}')
+            return None
     
     # Get latest or desired mod version
     logging.debug(f'Getting files from CurseForge')
-    curseforge_mod_loader = { 'forge': 1, 'fabric': 4 }.get(mod_loader, None)
-    if mod_version == 'latest_version':
+    curseforge_mod_loader = { 'forge': 1, 'fabric': 4 }.get(mod_loader, None) # Packs are not filtered by loader
+    if isLatestVersion(mod_version):
         try:
-            url = (f'https://api.curseforge.com/v1/mods/{curseforge_mod_id}/files')
+            url = (f'{api_url}/mods/{curseforge_mod_id}/files')
             params = {'gameVersion': str(minecraft_version), 'modLoaderType': curseforge_mod_loader}
-            response = requests.get(url, params = params, headers = curseforge_header).json()['data']
-            desired_mod_version_file = list(file for file in response if minecraft_version in file['gameVersions'])[0]
+            response = getCurseforgeFiles(url, params, curseforge_header)
+            candidates = (file for file in response if minecraft_version in file['gameVersions'])
+            desired_mod_version_file = selectVersion(candidates, lambda file: CURSEFORGE_RELEASE_TYPES.get(file.get('releaseType'), 'release'), lambda file: file.get('fileDate', ''), mod_version.removeprefix('latest_'))
+            if desired_mod_version_file is None:
+                raise LookupError(f'No file for {minecraft_version}')
         except Exception as e:
             logging.warning(f'Could not find "{mod_id}" for {mod_loader} {minecraft_version}. https://www.curseforge.com/minecraft/mc-mods/{mod_id}')
-            return
+            return None
     else:
         try:
-            desired_mod_version_file = requests.get(f'https://api.curseforge.com/v1/mods/{curseforge_mod_id}/files/{mod_version}', params = {'modLoaderType': curseforge_mod_loader}, headers = curseforge_header).json()['data']
+            desired_mod_version_file = getJSON(f'{api_url}/mods/{curseforge_mod_id}/files/{mod_version}', {'modLoaderType': curseforge_mod_loader}, curseforge_header, 'CurseForge')['data']
         except Exception as e:
             logging.warning(f'Could not find "{mod_id} {mod_version}" for {mod_loader} {minecraft_version}')
+            return None
     
-    logging.debug(f'Downloading desired version from CurseForge')
     file_name = desired_mod_version_file['fileName']
     download_url = desired_mod_version_file['downloadUrl']
     if download_url == None:
         logging.debug(f'Mod dev has disabled extenal program support for this mod, but I have a workaround ;)')
         download_url = f'https://edge.forgecdn.net/files/{str(desired_mod_version_file["id"])[0:4]}/{str(desired_mod_version_file["id"])[4:7]}/{file_name}'
-    download_path = os.path.join(download_dir, mod_loader, minecraft_version)
-    downloaded_file_path = os.path.join(download_path, file_name)
     
-    if not os.path.exists(downloaded_file_path) or checkIfZipIsCorrupted(downloaded_file_path):
+    return {
+        'site': 'curseforge.com', 'project': mod_id, 'loader': mod_loader, 'game_version': minecraft_version, 'mod_version': mod_version,
+        'version_id': str(desired_mod_version_file['id']),
+        'file_name': file_name,
+        'url': download_url,
+        'hashes': {CURSEFORGE_HASH_ALGORITHMS[file_hash['algo']]: file_hash['value'] for file_hash in desired_mod_version_file.get('hashes', []) if file_hash['algo'] in CURSEFORGE_HASH_ALGORITHMS},
+        'project_id': str(curseforge_mod_id),
+        'dependencies': [{'project': str(dependency['modId']), 'type': CURSEFORGE_DEPENDENCY_TYPES[dependency['relationType']]} for dependency in desired_mod_version_file.get('dependencies', [])
+                         if dependency.get('relationType') in CURSEFORGE_DEPENDENCY_TYPES]
+    }
+
+def siteHeaders(site: str, curseforge_api_key: str | None = None) -> dict:
+    if site == 'curseforge.com':
+        return {'Accept': 'application/json','x-api-key': curseforge_api_key}
+    return MODRINTH_HEADERS
+
+def fileKey(file: ResolvedFile | LockedFile) -> ModKey:
+    return ModKey(file['site'], file['project'], file['loader'], file['game_version'], file['mod_version'])
+
+def runJobs(function: typing.Callable, jobs: list[tuple], max_workers: int) -> list:
+    """Runs function(*job) for every job on a thread pool and returns the results in job order.
+    Log records emitted by a job are held back and flushed together once it finishes, so concurrent jobs do not interleave."""
+    def runJob(index: int, job: tuple) -> tuple[int, typing.Any, list[logging.LogRecord]]:
+        job_log_buffer.records = []
         try:
-            response = requests.get(download_url, headers = curseforge_header)
-            with open(downloaded_file_path, 'wb') as f: f.write(response.content)
+            result = function(*job)
         except Exception as e:
-            logging.warning(f'Could not download "{mod_id}": {e}')
+            logging.warning(f'Could not finish a job: {repr(e)}')
+            logging.exception(e)
+            result = None
+        finally:
+            records = job_log_buffer.records
+            del job_log_buffer.records
+        return index, result, records
+    
+    logging.debug(f'Running {len(jobs)} jobs with up to {max_workers} workers')
+    results: list = [None] * len(jobs)
+    root_logger = logging.getLogger()
+    log_filter = JobLogFilter()
+    root_logger.addFilter(log_filter)
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers = max_workers) as executor:
+            futures = [executor.submit(runJob, index, job) for index, job in enumerate(jobs)]
+            for future in concurrent.futures.as_completed(futures):
+                index, result, records = future.result()
+                for record in records:
+                    root_logger.handle(record)
+                results[index] = result
+    finally:
+        root_logger.removeFilter(log_filter)
+    return results
+
+def runProcessJobs(function: typing.Callable, jobs: list[tuple], max_workers: int) -> list:
+    """Runs function(*job) for every job on a process pool and returns the results in job order, for CPU-bound work that
+    threads cannot spread across cores. function must be a module level function that does not log, and its arguments and
+    result should be small as they are sent between processes. Small batches are run in-process."""
+    if max_workers > 1 and len(jobs) >= PROCESS_POOL_MIN_JOBS:
+        logging.debug(f'Running {len(jobs)} jobs with up to {max_workers} worker processes')
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers = max_workers) as executor:
+                return list(executor.map(function, *zip(*jobs), chunksize = max(1, len(jobs) // (max_workers * 4))))
+        except (OSError, concurrent.futures.BrokenExecutor) as e:
+            logging.warning(f'Could not use worker processes ({repr(e)}), running the jobs in this process instead.')
+    return [function(*job) for job in jobs]
+
+def resolveFiles(keys: list[ModKey], resolved_files: dict[ModKey, ResolvedFile | None], config: Config) -> None:
+    """Resolves the file each key should install into resolved_files. Modrinth projects are fetched in bulk first."""
+    modrinth_ids = [key.project for key in keys if key.site == 'modrinth.com']
+    modrinth_versions = resolveModrinthProjects(modrinth_ids, config['Modrinth API URL']) if modrinth_ids else {}
+    version_indexes = {key.project: indexModrinthVersions(modrinth_versions[key.project]) for key in keys
+                       if key.site == 'modrinth.com' and not isLatestVersion(key.mod_version) and key.project in modrinth_versions}
+    
+    def resolveJob(key: ModKey) -> ResolvedFile | None:
+        with run_report.timeMod(describeKey(key), 'resolve'):
+            return resolveKey(key)
+    
+    def resolveKey(key: ModKey) -> ResolvedFile | None:
+        if key.site == 'modrinth.com':
+            return resolveModrinthFile(key.project, key.loader, key.game_version, key.mod_version, modrinth_versions.get(key.project), version_indexes.get(key.project))
+        if key.site == 'curseforge.com':
+            return resolveCurseforgeFile(key.project, key.loader, key.game_version, key.mod_version, config['CurseForge API Key'], config['CurseForge API URL'])
+        return None
+    
+    resolved_files.update(zip(keys, runJobs(resolveJob, [(key,) for key in keys], config['Max Download Workers'])))
+
+def dependencyKey(file: ResolvedFile, dependency: Dependency, resolved_projects: dict[tuple[str, str, str, str], ModKey]) -> ModKey:
+    """Returns the key a dependency resolves through, reusing an already resolved latest version of the same project."""
+    node = (file['site'], dependency['project'], file['loader'], file['game_version'])
+    return resolved_projects.get(node, ModKey(*node, file['mod_version'] if isLatestVersion(file['mod_version']) else latestVersion('release')))
+
+def resolvedProjects(resolved_files: dict[ModKey, ResolvedFile | None]) -> dict[tuple[str, str, str, str], ModKey]:
+    return {(key.site, file['project_id'], key.loader, key.game_version): key for key, file in resolved_files.items()
+            if file is not None and isLatestVersion(key.mod_version)}
+
+def resolveDependencies(resolved_files: dict[ModKey, ResolvedFile | None], config: Config) -> None:
+    """Resolves the required dependencies of every resolved file, transitively, into resolved_files.
+    A (project, loader, game version) node is resolved once per run no matter how many mods or instances need it."""
+    while True:
+        resolved_projects = resolvedProjects(resolved_files)
+        missing: list[ModKey] = []
+        for file in resolved_files.values():
+            for dependency in (file or {}).get('dependencies', []):
+                if dependency['type'] != 'required':
+                    continue
+                key = dependencyKey(file, dependency, resolved_projects)
+                if key not in resolved_files and key not in missing:
+                    missing.append(key)
+        if not missing:
             return
-        logging.info(f'Downloaded "{file_name}" into "{download_path}"')
+        logging.info(f'Resolving {len(missing)} dependencies')
+        resolveFiles(missing, resolved_files, config)
+
+def walkDependencies(keys: list[ModKey], resolved_files: dict[ModKey, ResolvedFile | None]) -> list[ModKey]:
+    """Returns the keys of an instance followed by the keys of everything they require, transitively.
+    A project the instance already lists is never pulled in a second time as a dependency, nor is a downloaded dependency whose jar
+    declares the same mod id as one of the instance's mods, e.g. a library the instance lists from the other site."""
+    resolved_projects = resolvedProjects(resolved_files)
+    provided = {(key.site, resolved_files[key]['project_id']) for key in keys if resolved_files.get(key) is not None}
+    provided_mod_ids: set[str | None] | None = None # Only read from the jars once a dependency needs checking
+    walked: list[ModKey] = list(keys)
     
-    logging.debug(f'Copying downloaded file into instance(s)')
-    for instance_dir in instance_dirs:
-        instance_dir = os.path.join(instance_dir, 'mods')
-        instance_file_path = os.path.join(instance_dir, file_name)
-        if os.path.exists(instance_dir) and os.path.exists(downloaded_file_path):
-            if not os.path.isfile(instance_file_path) or checkIfZipIsCorrupted(instance_file_path):
-                try:
-                    shutil.copy(downloaded_file_path, instance_file_path)
-                    logging.info(f'Copied "{downloaded_file_path}" to "{instance_dir}"')
-                except Exception as e:
-                    logging.warning(f'Could not copy "{downloaded_file_path}" into "{instance_dir}": {e}')
+    def walk(key: ModKey, path: list[ModKey]) -> None:
+        nonlocal provided_mod_ids
+        file = resolved_files.get(key)
+        if file is None:
+            return
+        for dependency in file.get('dependencies', []):
+            if dependency['type'] != 'required':
+                continue
+            dependency_key = dependencyKey(file, dependency, resolved_projects)
+            if dependency_key in path:
+                logging.debug(f'Dependency cycle: {" -> ".join(step.project for step in path + [dependency_key])}')
+                continue
+            if (file['site'], dependency['project']) in provided:
+                continue
+            provided.add((file['site'], dependency['project']))
+            mod_id = storedModId(resolved_files[dependency_key]) if resolved_files.get(dependency_key) is not None else None
+            if mod_id is not None:
+                if provided_mod_ids is None:
+                    provided_mod_ids = {storedModId(resolved_files[key]) for key in keys if resolved_files.get(key) is not None}
+                if mod_id in provided_mod_ids:
+                    logging.info(f'Not adding {dependency_key.project} ({dependency_key.site}), required by {key.project}: the instance already has mod id "{mod_id}"')
                     continue
+            walked.append(dependency_key)
+            logging.debug(f'{key.project} requires {dependency_key.project}')
+            walk(dependency_key, path + [dependency_key])
+    
+    for key in keys:
+        walk(key, [key])
+    return walked
+
+def findConflicts(instance_name: str, files: list[LockedFile]) -> None:
+    """Warns about mods an instance contains twice, in different versions or from different sites, and about mods that declare each other incompatible."""
+    by_project: dict[tuple[str, str], list[LockedFile]] = {}
+    by_mod_id: dict[str, list[LockedFile]] = {}
+    for file in files:
+        by_project.setdefault((file['site'], file.get('project_id', file['project'])), []).append(file)
+        mod_id = storedModId(file)
+        if mod_id is not None:
+            by_mod_id.setdefault(mod_id, []).append(file)
+    for duplicates in by_project.values():
+        if len({file['file_name'] for file in duplicates}) > 1:
+            logging.warning(f'Instance "{instance_name}" contains {duplicates[0]["project"]} more than once: {", ".join(sorted({file["file_name"] for file in duplicates}))}')
+    for mod_id, duplicates in by_mod_id.items():
+        if len({(file['site'], file.get('project_id', file['project'])) for file in duplicates}) > 1:
+            projects = sorted(f'{file["project"]} ({file["site"]})' for file in duplicates)
+            logging.warning(f'Instance "{instance_name}" contains mod id "{mod_id}" from more than one project: {", ".join(projects)}')
+    for file in files:
+        for dependency in file.get('dependencies', []):
+            if dependency['type'] == 'incompatible' and (file['site'], dependency['project']) in by_project:
+                logging.warning(f'Instance "{instance_name}" contains {file["project"]} and {by_project[(file["site"], dependency["project"])][0]["project"]}, which {file["project"]} declares incompatible.')
+
+def installFolder(instance: Instance, project_type: str) -> str:
+    """Folder files of a project type (a ModKey loader) are deployed into: mods, resourcepacks or shaderpacks in the instance, or the datapacks folder of its world."""
+    if project_type == 'datapack':
+        return os.path.join(str(instance['Directory']), instance.get('World', 'world'), PACK_FOLDERS[project_type])
+    return os.path.join(str(instance['Directory']), PACK_FOLDERS.get(project_type, 'mods'))
+
+def hashInstance(instance: Instance) -> str:
+    """Hashes an instance, and for instances with datapacks whether their world folder exists, as datapacks are only installed into an existing world."""
+    state = dict(instance)
+    if any(parsed_url is not None and parsed_url[1] == 'datapack' for parsed_url in map(parseModURL, extractNestedStrings(instance['Mods']))):
+        state['World Exists'] = os.path.isdir(os.path.join(str(instance['Directory']), instance.get('World', 'world')))
+    return hashlib.sha1(json.dumps(state, sort_keys = True, default = str).encode('utf-8')).hexdigest()
+
+def lockfilePath(config: Config, instance_name: str) -> str:
+    return os.path.join(config['Downloads Folder'], 'locks', f'{instance_name}.lock.json')
 
-def updateMods(instances: ParsedInstances, config: Config) -> None:
-    logging.debug(f'Creating folders to download mods into')
-    for mod_loader in instances:
-        for minecraft_version in instances[mod_loader]['mods']:
-            dir = ""
+def readLockfile(config: Config, instance_name: str) -> Lockfile | None:
+    path = lockfilePath(config, instance_name)
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, 'r', encoding = 'utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logging.warning(f'Could not read lockfile "{path}", resolving the instance again: {repr(e)}')
+        return None
+
+def writeLockfile(config: Config, instance_name: str, lockfile: Lockfile) -> None:
+    path = lockfilePath(config, instance_name)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        with open(f'{path}.tmp', 'w', encoding = 'utf-8') as f:
+            json.dump(lockfile, f, indent = 4)
+        os.replace(f'{path}.tmp', path)
+    except Exception as e:
+        logging.warning(f'Could not write lockfile "{path}": {repr(e)}')
+
+def storedBlobPath(file: ResolvedFile | LockedFile) -> str | None:
+    """Returns where a resolved file is in the download store, without verifying it, or None if it has not been downloaded."""
+    blob = file['hashes'].get('sha1', '').lower() or download_store.lookup(fileKey(file), file['file_name'])
+    if blob is None:
+        return None
+    blob_path = download_store.blobPath(blob)
+    return blob_path if os.path.isfile(blob_path) else None
+
+def isFileStored(file: ResolvedFile) -> bool:
+    blob_path = storedBlobPath(file)
+    return blob_path is not None and verifyFile(blob_path, file['hashes'])
+
+@functools.lru_cache(maxsize = None)
+def blobModId(blob_path: str, mod_loader: str) -> str | None:
+    """Returns the mod id declared inside a jar in the download store. Memoized, as blobs never change."""
+    metadata, warning = scanModJar(blob_path, mod_loader)
+    if warning is not None:
+        logging.debug(warning)
+    return metadata[0] if metadata is not None else None
+
+def storedModId(file: ResolvedFile | LockedFile) -> str | None:
+    """Returns the mod id declared inside the jar a mod resolved to, or None if it is not a mod or has not been downloaded yet."""
+    if file['loader'] in PACK_FOLDERS or download_store is None:
+        return None
+    blob_path = storedBlobPath(file)
+    return blobModId(blob_path, file['loader']) if blob_path is not None else None
+
+def planUpdate(instances: Instances, config: Config, resolve_all: bool = False) -> Plan:
+    """Works out what the enabled instances should contain and diffs that against what RMMUD last deployed.
+    Instances whose file has not changed and whose lockfile is younger than the Lockfile Max Age reuse their locked files without
+    resolving anything, unless resolve_all is set."""
+    logging.info(f'PLANNING UPDATE')
+    now = time.time()
+    
+    locks: dict[str, Lockfile | None] = {}
+    stale_instances: Instances = {}
+    for instance_name, instance in instances.items():
+        lock = locks[instance_name] = readLockfile(config, instance_name)
+        if resolve_all or lock is None or lock.get('instance_hash') != hashInstance(instance) or now - lock.get('resolved_at', 0) > config['Lockfile Max Age']:
+            stale_instances[instance_name] = instance
+    logging.info(f'{len(instances) - len(stale_instances)} instance(s) unchanged since they were last resolved, resolving {len(stale_instances)} instance(s)')
+    
+    listed_jobs = parseInstances(instances)
+    instance_jobs: dict[str, list[ModKey]] = {}
+    for key, job in listed_jobs.items():
+        for instance_name in job.instances & stale_instances.keys():
+            instance_jobs.setdefault(instance_name, []).append(key)
+    datapack_fallbacks: set[tuple[str, ModKey]] = set() # (instance, mod version of a Modrinth datapack), for instances without a world folder
+    for instance_name, keys in instance_jobs.items():
+        instance = stale_instances[instance_name]
+        world_dir = os.path.join(str(instance['Directory']), instance.get('World', 'world'))
+        if not any(key.loader == 'datapack' for key in keys) or os.path.isdir(world_dir):
+            continue
+        instance_keys: list[ModKey] = []
+        for key in keys:
+            if key.loader != 'datapack':
+                instance_keys.append(key)
+            elif key.site == 'modrinth.com':
+                fallback_key = key._replace(loader = str(instance['Loader']).lower())
+                if fallback_key not in keys:
+                    datapack_fallbacks.add((instance_name, fallback_key))
+                    instance_keys.append(fallback_key)
+            else:
+                logging.warning(f'Skipping datapack {key.project} in instance "{instance_name}" until its world folder "{world_dir}" exists.')
+        instance_jobs[instance_name] = instance_keys
+    resolved_files: dict[ModKey, ResolvedFile | None] = {}
+    resolveFiles(list(dict.fromkeys(key for keys in instance_jobs.values() for key in keys)), resolved_files, config)
+    if config['Download Dependencies']:
+        resolveDependencies(resolved_files, config)
+    
+    plan: Plan = {'installs': [], 'deletes': [], 'up_to_date': 0, 'failed': [], 'lockfiles': {}, 'deployed': {}}
+    installs: dict[tuple[ModKey, str, str | None], PlannedInstall] = {} # By the file itself, as instances with older lockfiles may lock another version of a key
+    deployed_checks: list[tuple[LockedFile, PlannedInstall]] = []
+    desired_paths: set[str] = set()
+    for instance_name, instance in instances.items():
+        lock = locks[instance_name]
+        if instance_name not in stale_instances:
+            plan['lockfiles'][instance_name] = lock
+        else:
+            locked_files: dict[tuple[str, str], list[LockedFile]] = {}
+            for file in (lock['files'] if lock is not None else []):
+                locked_files.setdefault((file['site'], file['project']), []).append(file)
+            lockfile: Lockfile = {'instance_hash': hashInstance(instance), 'resolved_at': now, 'files': []}
+            listed_keys = instance_jobs.get(instance_name, [])
+            instance_keys = listed_keys
+            if config['Download Dependencies']:
+                instance_keys = walkDependencies(listed_keys, resolved_files)
+                if any(resolved_files.get(key) is not None and storedBlobPath(resolved_files[key]) is None for key in instance_keys[len(listed_keys):]):
+                    lockfile['resolved_at'] = 0 # Check the new dependencies against the instance's mods by jar mod id once they are downloaded
+            for key in instance_keys:
+                file = resolved_files.get(key)
+                if file is None and (instance_name, key) in datapack_fallbacks:
+                    logging.info(f'Skipping datapack {key.project} in instance "{instance_name}" until its world folder exists, it has no mod version for {key.loader} {key.game_version}.')
+                    continue
+                if file is None:
+                    if describeKey(key) not in plan['failed']:
+                        plan['failed'].append(describeKey(key))
+                        run_report.recordFailure('resolve', describeKey(key))
+                    lockfile['resolved_at'] = 0 # Resolve this instance again next run
+                    for locked_file in locked_files.pop((key.site, key.project), []): # Even if the key changed, e.g. a mod link that became a datapack link
+                        logging.info(f'Keeping the previously locked "{locked_file["file_name"]}" in instance "{instance_name}"')
+                        lockfile['files'].append(locked_file)
+                    continue
+                lockfile['files'].append({**file, 'path': os.path.join(installFolder(instance, file['loader']), file['file_name'])})
+            plan['lockfiles'][instance_name] = lockfile
+            findConflicts(instance_name, lockfile['files'])
+        
+        for file in plan['lockfiles'][instance_name]['files']:
+            desired_paths.add(file['path'])
+            job = listed_jobs.get(fileKey(file))
+            deployed = plan['deployed'].setdefault(str(instance['Directory']), {})
+            deployed[file['file_name']] = deployed.get(file['file_name'], False) or (job is not None and instance_name in job.instances) or (instance_name, fileKey(file)) in datapack_fallbacks
+            install_key = (fileKey(file), file['version_id'], file['hashes'].get('sha1'))
+            install = installs.get(install_key)
+            if install is None:
+                resolved_file: ResolvedFile = {key: value for key, value in file.items() if key != 'path'}
+                install = installs[install_key] = {'file': resolved_file, 'download': None, 'targets': []}
+            deployed_checks.append((file, install))
+    
+    for (file, install), verified in zip(deployed_checks, verifyFiles([(file['path'], file['hashes']) for file, _ in deployed_checks], config['Max Scan Workers'])):
+        if verified:
+            plan['up_to_date'] += 1
+        elif file['path'] not in install['targets']:
+            install['targets'].append(file['path'])
+    
+    for instance_name, lock in locks.items():
+        for file in (lock['files'] if lock is not None else []):
+            if file['path'] not in desired_paths and os.path.lexists(file['path']):
+                plan['deletes'].append((file['path'], fileKey(file), str(instances[instance_name]['Directory'])))
+                desired_paths.add(file['path'])
+    
+    for install in installs.values():
+        if install['targets']:
+            install['download'] = not isFileStored(install['file'])
+            plan['installs'].append(install)
+    
+    return plan
+
+def printPlan(plan: Plan, verbose: bool = False) -> None:
+    log = logging.info if verbose else logging.debug
+    for install in plan['installs']:
+        file = install['file']
+        if install['download']:
+            log(f'Download "{file["file_name"]}" ({file["project"]} for {file["loader"]} {file["game_version"]})')
+        for target in install['targets']:
+            log(f'Deploy "{file["file_name"]}" into "{os.path.dirname(target)}"')
+    for path, _, _ in plan['deletes']:
+        log(f'Delete "{path}"')
+    logging.info(f'Plan: {sum(1 for install in plan["installs"] if install["download"])} download(s), '
+                 f'{sum(len(install["targets"]) for install in plan["installs"])} deploy(s), '
+                 f'{len(plan["deletes"])} delete(s), {plan["up_to_date"]} file(s) up to date.')
+    if plan['failed']:
+        logging.warning(f'Could not resolve {len(plan["failed"])} mod(s): {", ".join(sorted(plan["failed"]))}')
+
+def storeResolvedFile(file: ResolvedFile, config: Config) -> str:
+    legacy_file_path = os.path.join(config['Downloads Folder'], file['loader'], file['game_version'], file['file_name'])
+    return storeFile(fileKey(file), file['url'], siteHeaders(file['site'], config['CurseForge API Key']), file['file_name'], file['hashes'], legacy_file_path)
+
+def installFile(file: ResolvedFile, targets: list[str], config: Config) -> bool:
+    """Makes sure a resolved file is in the download store and deploys it to each target path."""
+    logging.info(f'Updating {file["project"]} for {file["loader"]} {file["game_version"]}')
+    file_name = file['file_name']
+    mod = describeKey(fileKey(file))
+    
+    try:
+        with run_report.timeMod(mod, 'download'):
+            downloaded_file_path = storeResolvedFile(file, config)
+    except Exception as e:
+        logging.warning(f'Could not download "{file["project"]}": {e}')
+        return False
+    
+    logging.debug(f'Copying downloaded file into instance(s)')
+    success = True
+    with run_report.timeMod(mod, 'copy'):
+        for target in targets:
+            instance_dir = os.path.dirname(target)
+            if not os.path.exists(instance_dir) and file['loader'] in PACK_FOLDERS and os.path.isdir(os.path.dirname(instance_dir)):
+                os.makedirs(instance_dir, exist_ok = True) # The game only creates these folders once it first needs them
+            if not os.path.exists(instance_dir):
+                logging.warning(f'Could not copy "{downloaded_file_path}" into "{instance_dir}": Could not find "{instance_dir}"')
+                success = False
+                continue
             try:
-                dir = os.path.join(config['Downloads Folder'], mod_loader, minecraft_version)
-                os.makedirs(dir, exist_ok = True)
+                used_mode = deployFile(downloaded_file_path, target, config['Deployment Mode'])
+                markFileVerified(target, file['hashes'])
+                logging.info(f'Deployed "{file_name}" into "{instance_dir}" ({used_mode})')
             except Exception as e:
-                logging.warning(f'Could not create download folder {dir}: {e}')
-                raise e
-    
+                logging.warning(f'Could not copy "{downloaded_file_path}" into "{instance_dir}": {e}')
+                success = False
+    return success
+
+def executePlan(plan: Plan, config: Config) -> None:
     logging.info(f'UPDATING MODS')
-    for mod_loader in instances:
-        for minecraft_version in instances[mod_loader]['mods']:
-            for mod_id in instances[mod_loader]['mods'][minecraft_version]:
-                for website in instances[mod_loader]['mods'][minecraft_version][mod_id]:
-                    for mod_version in instances[mod_loader]['mods'][minecraft_version][mod_id][website]:
-                        instance_dirs = instances[mod_loader]['mods'][minecraft_version][mod_id][website][mod_version]['directories']
-                        if website == 'modrinth.com':
-                            downloadModrinthMod(mod_id, mod_loader, minecraft_version, mod_version, config['Downloads Folder'], instance_dirs)
-                        elif website == 'curseforge.com':
-                            downloadCurseforgeMod(mod_id, mod_loader, minecraft_version, mod_version, config['Downloads Folder'], instance_dirs, config['CurseForge API Key'])
-
-def deleteDuplicateMods(instances: Instances) -> None:
-    logging.info(f'DELETING OUTDATED MODS')
+    results = runJobs(installFile, [(install['file'], install['targets'], config) for install in plan['installs']], config['Max Download Workers'])
     
-    def scanFolder(instance_dir: str) -> None:
-        logging.debug(f'Scanning for old mods')
-        instance_dir = os.path.join(instance_dir, 'mods')
-        ids: dict[str, dict[float, str]] = {}
-        
-        if os.path.exists(instance_dir):
-            for mod_file in [f for f in os.listdir(instance_dir) if f.endswith('.jar')]:
-                mod_path = os.path.join(instance_dir, mod_file)
-                date_created = os.path.getctime(mod_path)
-                with zipfile.ZipFile(mod_path) as zip_file:
-                    with zip_file.open('fabric.mod.json') as f:
-                        id = json.load(f, strict=False)['id']
-                        ids.setdefault(id, {})
-                ids[id][date_created] = mod_path
-            
-            ids = {key: dates for key, dates in ids.items() if len(dates) > 1}
-            
-            if ids:
-                logging.debug(f'Deleting old mods')
-                for mod_id, dates in ids.items():
-                    latest_date = max(dates.keys())
-                    for date_created, path in dates.items():
-                        if date_created != latest_date:
-                            try:
-                                os.remove(path)
-                                logging.info(f'Deleted old {mod_id} file: "{path}"')
-                            except Exception as e:
-                                logging.warning(f'Could not delete old {mod_id} file "{path}": {e}')
+    failed_jobs: list[str] = []
+    failed_targets: dict[tuple[str, str], list[str]] = {}
+    for install, success in zip(plan['installs'], results):
+        if not success:
+            file = install['file']
+            failed_jobs.append(describeKey(fileKey(file)))
+            run_report.recordFailure('update', describeKey(fileKey(file)))
+            failed_targets.setdefault((file['site'], file['project']), []).extend(install['targets'])
+    logging.info(f'Updated {len(plan["installs"]) - len(failed_jobs)}/{len(plan["installs"])} mods successfully.')
+    if failed_jobs:
+        logging.warning(f'Could not update {len(failed_jobs)} mod(s): {", ".join(sorted(failed_jobs))}')
+    
+    for path, key, instance_dir in plan['deletes']:
+        if any(target.startswith(os.path.join(instance_dir, '')) for target in failed_targets.get((key.site, key.project), [])):
+            logging.info(f'Keeping "{path}" because its replacement could not be installed')
+            continue
+        try:
+            os.remove(path)
+            logging.info(f'Deleted "{path}" as it is no longer in its instance')
+        except Exception as e:
+            logging.warning(f'Could not delete "{path}": {e}')
+    
+    for instance_name, lockfile in plan['lockfiles'].items():
+        writeLockfile(config, instance_name, lockfile)
+    
+    if download_store is not None:
+        blob_count, blob_bytes, saved_bytes = download_store.deduplicationSavings()
+        logging.info(f'Download store holds {blob_count} file(s) ({blob_bytes} bytes), deduplication saved {saved_bytes} bytes.')
+
+def updateMods(instances: Instances, config: Config, dry_run: bool = False, offline: bool = False, resolve_all: bool = False) -> DeployedFiles:
+    with run_report.stage('plan'):
+        plan = planUpdate(instances, config, resolve_all)
+    printPlan(plan, dry_run)
+    if offline:
+        missing_files = [install['file']['file_name'] for install in plan['installs'] if install['download']]
+        if plan['failed']:
+            raise OfflineError(f'Could not resolve {len(plan["failed"])} mod(s) offline: {", ".join(sorted(plan["failed"]))}')
+        if missing_files:
+            raise OfflineError(f'{len(missing_files)} file(s) are not in the download store: {", ".join(sorted(missing_files))}')
+    if not dry_run:
+        with run_report.stage('update'):
+            executePlan(plan, config)
+    return plan['deployed']
+
+def collectGarbage(instances: Instances, config: Config) -> None:
+    logging.info(f'COLLECTING GARBAGE')
+    live_files: set[tuple[ModKey, str]] = set()
+    for instance_name in instances:
+        lockfile = readLockfile(config, instance_name)
+        live_files.update((fileKey(file), file['file_name']) for file in (lockfile['files'] if lockfile is not None else [])) # Includes dependencies
+    removed_files, removed_bytes = download_store.collectGarbage(live_files)
+    logging.info(f'Removed {removed_files} unreferenced file(s) from the download store, freeing {removed_bytes} bytes.')
+
+def exportBundle(instances: Instances, config: Config, path: str) -> None:
+    """Resolves every enabled instance, downloads anything missing into the download store and writes the metadata,
+    manifest and files they use into a single archive that --offline runs can import."""
+    logging.info(f'EXPORTING BUNDLE')
+    plan = planUpdate(instances, config, resolve_all = True)
+    files = {(fileKey(file), file['file_name']): file for lockfile in plan['lockfiles'].values() for file in lockfile['files']} # Instances can lock different files of a key
+    if plan['failed']:
+        logging.warning(f'The bundle will not contain {len(plan["failed"])} mod(s) that could not be resolved: {", ".join(sorted(plan["failed"]))}')
+    
+    blob_paths = runJobs(storeResolvedFile, [(file, config) for file in files.values()], config['Max Download Workers'])
+    manifest: list[list[str]] = []
+    for (key, file_name), blob_path in zip(files, blob_paths):
+        if blob_path is None:
+            logging.warning(f'The bundle will not contain "{file_name}", it could not be downloaded.')
+            continue
+        manifest.append([*key, file_name, os.path.basename(blob_path)])
+    
+    import zipfile
+    try:
+        with zipfile.ZipFile(f'{path}.tmp', 'w', zipfile.ZIP_DEFLATED) as bundle:
+            bundle.writestr('bundle.json', json.dumps({
+                'format': BUNDLE_FORMAT_VERSION,
+                'rmmud_version': __version__,
+                'created_at': time.time(),
+                'metadata': metadata_cache.exportRows(metadata_cache.used_keys),
+                'manifest': manifest
+            }))
+            for blob in sorted({row[6] for row in manifest}):
+                bundle.write(download_store.blobPath(blob), f'store/{blob[:2]}/{blob}', zipfile.ZIP_STORED) # Jars are already compressed
+        os.replace(f'{path}.tmp', path)
+    except Exception as e:
+        logging.error(f'Could not write the bundle "{path}".')
+        logging.exception(e)
+        raise e
+    logging.info(f'Exported {len(metadata_cache.used_keys)} metadata entries and {len(manifest)} file(s) to "{path}"')
+
+def importBundle(path: str) -> None:
+    """Loads a bundle written by exportBundle into the metadata cache and download store."""
+    logging.info(f'IMPORTING BUNDLE')
+    import zipfile
+    try:
+        with zipfile.ZipFile(path) as bundle:
+            info = json.loads(bundle.read('bundle.json'))
+            if info.get('format') != BUNDLE_FORMAT_VERSION:
+                raise ValueError(f'Unsupported bundle format {info.get("format")}, expected {BUNDLE_FORMAT_VERSION}.')
+            for name in bundle.namelist():
+                if not name.startswith('store/') or name.endswith('/'):
+                    continue
+                blob = name.rsplit('/', 1)[1]
+                blob_path = download_store.blobPath(blob)
+                if os.path.isfile(blob_path):
+                    continue
+                os.makedirs(os.path.dirname(blob_path), exist_ok = True)
+                with bundle.open(name) as source, open(f'{blob_path}.part', 'wb') as destination:
+                    shutil.copyfileobj(source, destination, DOWNLOAD_CHUNK_SIZE)
+                if hashFile(f'{blob_path}.part', 'sha1') != blob:
+                    os.remove(f'{blob_path}.part')
+                    raise ValueError(f'"{name}" in the bundle is corrupted.')
+                os.replace(f'{blob_path}.part', blob_path)
+            metadata_cache.importRows([tuple(row) for row in info['metadata']])
+            for row in info['manifest']:
+                download_store.record(ModKey(*row[:5]), row[5], row[6])
+    except Exception as e:
+        logging.error(f'Could not import the bundle "{path}".')
+        logging.exception(e)
+        raise e
+    logging.info(f'Imported {len(info["metadata"])} metadata entries and {len(info["manifest"])} file(s) from "{path}"')
+
+def parseModMetadata(zip_file: 'zipfile.ZipFile', name: str) -> tuple[str, str] | None:
+    """Reads the mod id and version out of one metadata entry of a mod jar."""
+    with zip_file.open(name) as f:
+        data = f.read().decode('utf-8', errors = 'replace')
+    match name:
+        case 'fabric.mod.json':
+            metadata = json.loads(data, strict = False)
+            return str(metadata['id']), str(metadata.get('version', ''))
+        case 'quilt.mod.json':
+            metadata = json.loads(data, strict = False)['quilt_loader']
+            return str(metadata['id']), str(metadata.get('version', ''))
+        case 'META-INF/mods.toml' | 'META-INF/neoforge.mods.toml':
+            if tomllib is None:
+                logging.debug(f'Cannot read {name} files without tomllib (Python 3.11+).')
+                return None
+            metadata = tomllib.loads(data)['mods'][0]
+            version = str(metadata.get('version', ''))
+            if '${file.jarVersion}' in version and 'META-INF/MANIFEST.MF' in zip_file.NameToInfo:
+                with zip_file.open('META-INF/MANIFEST.MF') as f:
+                    for line in f.read().decode('utf-8', errors = 'replace').splitlines():
+                        if line.startswith('Implementation-Version:'):
+                            version = version.replace('${file.jarVersion}', line.split(':', 1)[1].strip())
+                            break
+            return str(metadata['modId']), version
+        case 'mcmod.info':
+            metadata = json.loads(data, strict = False)
+            if isinstance(metadata, dict):
+                metadata = metadata.get('modList', [])
+            return str(metadata[0]['modid']), str(metadata[0].get('version', ''))
+    return None
+
+def scanModJar(path: str, mod_loader: str = '') -> tuple[tuple[str, str] | None, str | None]:
+    """Returns the (mod id, version) declared inside a mod jar (None if it does not declare any) and a warning for the caller to
+    log if it could not be read. Only the central directory and the needed metadata entry are read, never the whole archive."""
+    import zipfile
+    names = MOD_METADATA_FILES.get(mod_loader, MOD_METADATA_FILES[''])
+    try:
+        with zipfile.ZipFile(path) as zip_file:
+            for name in names:
+                if name in zip_file.NameToInfo:
+                    metadata = parseModMetadata(zip_file, name)
+                    if metadata is not None:
+                        return metadata, None
+        return None, None
+    except Exception as e:
+        return None, f'Could not read the mod metadata of "{path}": {repr(e)}'
+
+def readModMetadata(path: str, mod_loader: str = '') -> tuple[str, str] | None:
+    """Returns the (mod id, version) declared inside a mod jar, or None if it does not declare any."""
+    metadata, warning = scanModJar(path, mod_loader)
+    if warning is not None:
+        logging.warning(warning)
+    elif metadata is None:
+        logging.debug(f'"{path}" does not contain any known mod metadata.')
+    return metadata
+
+def scanModFolders(folders: list[tuple[str, str]], max_workers: int = 1) -> dict[str, dict[str, tuple[int, int, str | None, str | None]]]:
+    """Returns the (size, mtime, mod id, version) of every jar in each (mods folder, loader), by folder and file name.
+    Jars that changed since they were last indexed are read on one process pool shared by all the folders."""
+    scanned: dict[str, dict[str, tuple[int, int, str | None, str | None]]] = {}
+    pending: list[tuple[str, str, os.stat_result]] = []
+    jobs: list[tuple[str, str]] = []
+    for mods_dir, mod_loader in folders:
+        indexed = mod_file_index.load(mods_dir) if mod_file_index is not None else {}
+        entries = scanned[mods_dir] = {}
+        for mod_file in [f for f in os.listdir(mods_dir) if f.endswith('.jar')]:
+            mod_path = os.path.join(mods_dir, mod_file)
+            try:
+                stat = os.stat(mod_path)
+            except OSError as e:
+                logging.warning(f'Could not read "{mod_path}": {e}')
+                continue
+            entry = indexed.get(mod_file)
+            if entry is None or entry[:2] != (stat.st_size, stat.st_mtime_ns):
+                pending.append((mods_dir, mod_file, stat))
+                jobs.append((mod_path, mod_loader))
             else:
-                logging.debug(f'No old mods to delete')
-        else:
-            logging.warning(f'Could not delete old mods in "{instance_dir}": Could not find "{instance_dir}"')
+                entries[mod_file] = entry
+    
+    logging.debug(f'Reading the mod metadata of {len(jobs)} new or changed jar(s)')
+    for (mods_dir, mod_file, stat), (metadata, warning) in zip(pending, runProcessJobs(scanModJar, jobs, max_workers)):
+        if warning is not None:
+            logging.warning(warning)
+        scanned[mods_dir][mod_file] = (stat.st_size, stat.st_mtime_ns, *(metadata or (None, None)))
+    if mod_file_index is not None:
+        for mods_dir, entries in scanned.items():
+            mod_file_index.save(mods_dir, entries)
+    return scanned
+
+def deleteDuplicateMods(instances: Instances, deployed_files: DeployedFiles | None = None, max_workers: int = 1) -> None:
+    logging.info(f'DELETING OUTDATED MODS')
+    deployed_files = deployed_files or {}
     
+    folders: dict[str, tuple[str, str]] = {}
     for instance_name, instance in instances.items():
+        mods_dir = os.path.join(str(instance['Directory']), 'mods')
+        if not os.path.exists(mods_dir):
+            logging.warning(f'Could not delete old mods in "{mods_dir}": Could not find "{mods_dir}"')
+            continue
+        folders.setdefault(mods_dir, (instance_name, instance['Loader']))
+    
+    scanned = scanModFolders([(mods_dir, mod_loader) for mods_dir, (_, mod_loader) in folders.items()], max_workers)
+    
+    for mods_dir, (instance_name, _) in folders.items():
         logging.info(f'Deleting old mods from instance: {instance_name}')
-        if instance['Loader'] == 'fabric':
-            instance_dir = instance['Directory']
-            scanFolder(instance_dir)
+        deployed = deployed_files.get(str(instances[instance_name]['Directory']), {})
+        ids: dict[str, list[tuple[int, str]]] = {}
+        for mod_file, entry in scanned[mods_dir].items():
+            if entry[2] is not None:
+                ids.setdefault(entry[2], []).append((entry[1], mod_file))
+        
+        ids = {key: files for key, files in ids.items() if len(files) > 1}
+        
+        if ids:
+            logging.debug(f'Deleting old mods')
+            for mod_id, files in ids.items():
+                deployed_files_of_mod = [(deployed[mod_file], mtime, mod_file) for mtime, mod_file in files if mod_file in deployed]
+                keep = max(deployed_files_of_mod)[2] if deployed_files_of_mod else max(files)[1] # Listed over required, then the newest
+                if len(deployed_files_of_mod) > 1:
+                    logging.warning(f'Instance "{instance_name}" got {mod_id} in more than one file: {", ".join(sorted(mod_file for _, _, mod_file in deployed_files_of_mod))}. Keeping "{keep}".')
+                for _, mod_file in files:
+                    if mod_file == keep:
+                        continue
+                    path = os.path.join(mods_dir, mod_file)
+                    try:
+                        os.remove(path)
+                        logging.info(f'Deleted old {mod_id} file: "{path}"')
+                    except Exception as e:
+                        logging.warning(f'Could not delete old {mod_id} file "{path}": {e}')
         else:
-            logging.warning(f'Cannot auto-delete old mods in {instance_dir}: Only fabric mods supported atm.')
+            logging.debug(f'No old mods to delete')
+
+def snapshotFolder(path: str, extension: str | tuple[str, ...]) -> dict[str, tuple[int, int]]:
+    """Returns the size and mtime of every file with the given extension(s) in a folder, to tell when the folder changed."""
+    snapshot: dict[str, tuple[int, int]] = {}
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.name.endswith(extension) and entry.is_file():
+                    stat = entry.stat()
+                    snapshot[entry.name] = (stat.st_size, stat.st_mtime_ns)
+    except OSError:
+        pass
+    return snapshot
+
+def snapshotInstance(instance: Instance) -> dict[str, dict[str, tuple[int, int]]]:
+    """Snapshots every folder RMMUD deploys into for an instance: mods, resourcepacks, shaderpacks and the datapacks of its world."""
+    folders = {installFolder(instance, project_type) for project_type in ('mod', *PACK_FOLDERS)}
+    return {folder: snapshotFolder(folder, ('.jar', '.zip')) for folder in sorted(folders)}
+
+def watchInstances(instances: Instances, config: Config, offline: bool = False) -> None:
+    """Keeps running, updating instances whose instance file or mod and pack folders changed every Watch Interval and every
+    instance every Upstream Poll Interval. The config, HTTP connections, caches and loaded instances stay in memory between updates."""
+    logging.info(f'WATCHING INSTANCES (press Ctrl+C to stop)')
+    instances_folder = snapshotFolder(config['Instances Folder'], '.yaml')
+    instance_folders: dict[str, dict[str, dict[str, tuple[int, int]]]] = {}
+    next_upstream_poll = time.monotonic() + config['Upstream Poll Interval']
+    changed_instances: Instances = dict(instances)
+    
+    try:
+        while True:
+            poll_upstream = time.monotonic() >= next_upstream_poll
+            if poll_upstream:
+                next_upstream_poll = time.monotonic() + config['Upstream Poll Interval']
+                changed_instances = dict(instances)
+            
+            if changed_instances:
+                logging.info(f'Updating {len(changed_instances)} instance(s): {", ".join(sorted(changed_instances))}')
+                try:
+                    deployed_files = updateMods(changed_instances, config, offline = offline, resolve_all = poll_upstream)
+                    with run_report.stage('delete duplicates'):
+                        deleteDuplicateMods(changed_instances, deployed_files, config['Max Scan Workers'])
+                except Exception as e:
+                    logging.error(f'Could not update instances: {repr(e)}. Trying again on the next change or upstream poll.')
+                    logging.exception(e)
+                for instance_name, instance in changed_instances.items():
+                    instance_folders[instance_name] = snapshotInstance(instance)
+                logging.info(f'Watching for changes.')
+            
+            time.sleep(config['Watch Interval'])
+            changed_instances = {}
+            
+            folder = snapshotFolder(config['Instances Folder'], '.yaml')
+            if folder != instances_folder:
+                instances_folder = folder
+                previous_instances = instances
+                try:
+                    instances = loadInstances(config['Instances Folder'], config['Max Scan Workers'])
+                except Exception as e:
+                    logging.error(f'Could not reload instances: {repr(e)}')
+                    logging.exception(e)
+                changed_instances = {name: instance for name, instance in instances.items() if previous_instances.get(name) != instance}
+                for instance_name in previous_instances.keys() - instances.keys():
+                    instance_folders.pop(instance_name, None)
+            
+            for instance_name, instance in instances.items():
+                if instance_name not in changed_instances and snapshotInstance(instance) != instance_folders.get(instance_name):
+                    logging.info(f'Mod or pack folders of instance "{instance_name}" changed.')
+                    changed_instances[instance_name] = instance
+    except KeyboardInterrupt:
+        logging.info(f'Stopped watching.')
+
+def parseArguments(args: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description = "RandomGgames' Minecraft Mod Updater and Downloader")
+    parser.add_argument('command', nargs = '?', default = 'run', choices = ('run', 'plan', 'gc', 'export-bundle', 'watch'),
+                        help = 'run: update all enabled instances (default). plan: only show what a run would change. gc: update, then delete downloads no enabled instance uses anymore. ' +
+                               'export-bundle: save everything the enabled instances need into a bundle for --offline runs. ' +
+                               'watch: keep running and update instances as their files change and as new mod versions come out.')
+    parser.add_argument('--dry-run', action = 'store_true', help = 'Only show what would be downloaded, deployed and deleted (same as the plan command).')
+    parser.add_argument('--offline', action = 'store_true', help = 'Never use the network, only the local cache and the --bundle if given. Fails if anything is missing.')
+    parser.add_argument('--profile', nargs = '?', const = 'RMMUD.prof', default = None,
+                        help = 'Profile the run with cProfile, write the stats to this file (default RMMUD.prof) and log the slowest functions.')
+    parser.add_argument('--bundle', default = None, help = 'Bundle to write with export-bundle (default RMMUDBundle.zip), or to import before an --offline run.')
+    return parser.parse_args(args)
 
-def main():
+def main(command: str = 'run', dry_run: bool = False, offline: bool = False, bundle: str | None = None):
+    global run_report
     logging.debug(f'Running main body of script')
+    run_report = RunReport(command)
     
-    config = loadConfigFile()
+    with run_report.stage('load config'):
+        config = loadConfigFile()
+        setupStateDatabase(config)
+        client = setupHTTPClient(config, offline)
+        metadata_cache.offline = offline
+    error = None
+    update_check = startUpdateCheck() if config['Check for RMMUD Updates'] and not offline else None
     try:
-        if config['Check for RMMUD Updates']: checkForUpdate()
+        if offline and bundle is not None:
+            with run_report.stage('import bundle'):
+                importBundle(bundle)
+        
+        with run_report.stage('load instances'):
+            instances = loadInstances(config['Instances Folder'], config['Max Scan Workers'])
+        with run_report.stage('parse instances'):
+            jobs = parseInstances(instances)
+        
+        dry_run = dry_run or command == 'plan'
+        
+        if command == 'watch':
+            watchInstances(instances, config, offline)
+        elif len(jobs) == 0:
+            logging.info(f'No instances exist!')
+        elif command == 'export-bundle':
+            with run_report.stage('export bundle'):
+                exportBundle(instances, config, bundle or 'RMMUDBundle.zip')
+        elif dry_run:
+            updateMods(instances, config, dry_run = True, offline = offline)
+        else:
+            deployed_files = updateMods(instances, config, offline = offline)
+            with run_report.stage('delete duplicates'):
+                deleteDuplicateMods(instances, deployed_files, config['Max Scan Workers'])
+            if command == 'gc':
+                with run_report.stage('collect garbage'):
+                    collectGarbage(instances, config)
+        if update_check is not None:
+            with run_report.stage('update check'):
+                finishUpdateCheck(update_check)
     except Exception as e:
-        logging.warning(f'Could not check for updates due to {repr(e)}... Update checks will have to be done manually due to the current or latest version tag.')
-    
-    instances = loadInstances(config['Instances Folder'])
-    parsed_instances = parseInstances(instances)
-    
-    if len(parsed_instances) == 0:
-        logging.info(f'No instances exist!')
-    else:
-        updateMods(parsed_instances, config)
-        deleteDuplicateMods(instances)
+        error = repr(e)
+        raise e
+    finally:
+        client.logStats()
+        if config['Run Report File'] is not None:
+            run_report.write(config['Run Report File'], run_report.summarize(client, metadata_cache, error))
+        closeStateDatabase()
     
     logging.info('Done.')
 
 if __name__ == '__main__':
+    arguments = parseArguments()
+    
     # Clear latest.log if it exists
     if os.path.exists('latest.log'):
         open('latest.log', 'w').close()
@@ -552,8 +2336,21 @@ if __name__ == '__main__':
     
     # Call main function
     try:
-        main()
+        if arguments.profile is not None:
+            import cProfile
+            import pstats
+            profiler = cProfile.Profile()
+            try:
+                profiler.runcall(main, arguments.command, arguments.dry_run, arguments.offline, arguments.bundle)
+            finally:
+                profiler.dump_stats(arguments.profile)
+                profile_summary = io.StringIO()
+                pstats.Stats(profiler, stream = profile_summary).sort_stats('cumulative').print_stats(25)
+                logging.info(f'Wrote profile to "{arguments.profile}". Slowest functions:\n{profile_summary.getvalue()}')
+        else:
+            main(arguments.command, arguments.dry_run, arguments.offline, arguments.bundle)
     except Exception as e:
         logging.error(f'{repr(e)}\nThe script could no longer continue to function due to the error described above. Please fix the issue described or go to https://github.com/RandomGgames/RMMUD to request help/report a bug')
-        input('Press any key to exit.')
+        if sys.stdin.isatty():
+            input('Press any key to exit.')
         exit(1)
@@ -0,0 +1,459 @@
+import argparse
+import hashlib
+import http.server
+import io
+import json
+import logging
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import typing
+import urllib.parse
+import yaml
+import zipfile
+
+import RMMUD
+
+"""Benchmarks for RMMUD. Everything runs against synthetic data in a temporary folder and a local stand-in for the
+Modrinth and CurseForge APIs, nothing is downloaded from the internet."""
+
+BENCHMARK_GAME_VERSIONS = ('1.20.1', '1.20.2')
+BENCHMARK_LOADERS = ('fabric', 'forge')
+CURSEFORGE_LOADER_TYPES = {'forge': 1, 'fabric': 4}
+TIME_TO_FIRST_WORK_TARGET = 0.25 # Seconds from launching RMMUD.py until it starts planning, on a run with nothing to update
+
+def writeSyntheticInstances(instances_dir: str, count: int, mods_per_instance: int) -> None:
+    logging.debug(f'Writing {count} synthetic instance files with {mods_per_instance} mods each')
+    os.makedirs(instances_dir, exist_ok = True)
+    for i in range(count):
+        instance = {
+            'Enabled': i % 10 != 0,
+            'Loader': ('fabric', 'forge', 'quilt', 'neoforge')[i % 4],
+            'Version': ('1.20.1', '1.20.2', '1.20.4')[i % 3],
+            'Directory': f'/instances/instance-{i}',
+            'Mods': {
+                'Performance': [f'https://modrinth.com/mod/mod-{(i + j) % 500}' for j in range(mods_per_instance // 2)],
+                'Content': [f'https://www.curseforge.com/minecraft/mc-mods/mod-{(i * 7 + j) % 500}' for j in range(mods_per_instance - mods_per_instance // 2)]
+            }
+        }
+        with open(os.path.join(instances_dir, f'Instance {i}.yaml'), 'w') as f:
+            yaml.dump(instance, f, sort_keys = False)
+
+def timeIt(function, *args) -> float:
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+def benchmarkInstanceLoading(count: int, mods_per_instance: int, workers: int) -> dict[str, float]:
+    """Times loading and parsing the instances folder: the old way (pure Python loader, sequential, no cache), and
+    with the C loader and process pool on a cold and on a warm instance cache."""
+    work_dir = tempfile.mkdtemp(prefix = 'RMMUDBenchmark')
+    try:
+        instances_dir = os.path.join(work_dir, 'RMMUDInstances')
+        writeSyntheticInstances(instances_dir, count, mods_per_instance)
+        results: dict[str, float] = {}
+
+        RMMUD.YAML_LOADER = yaml.SafeLoader
+        results['load, pure Python loader, sequential, no cache'] = timeIt(RMMUD.loadInstances, instances_dir, 1)
+        RMMUD.YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+        results['load, C loader, sequential, no cache'] = timeIt(RMMUD.loadInstances, instances_dir, 1)
+        results[f'load, C loader, {workers} workers, no cache'] = timeIt(RMMUD.loadInstances, instances_dir, workers)
+
+        RMMUD.state_database = RMMUD.StateDatabase(os.path.join(work_dir, 'RMMUDCache.sqlite3'))
+        RMMUD.instance_cache = RMMUD.InstanceCache(RMMUD.state_database)
+        results[f'load, C loader, {workers} workers, cold cache'] = timeIt(RMMUD.loadInstances, instances_dir, workers)
+        results[f'load, C loader, {workers} workers, warm cache'] = timeIt(RMMUD.loadInstances, instances_dir, workers)
+
+        instances = RMMUD.loadInstances(instances_dir, workers)
+        RMMUD.parseModURL.cache_clear()
+        results['parse instances, cold URL cache'] = timeIt(RMMUD.parseInstances, instances)
+        results['parse instances, warm URL cache'] = timeIt(RMMUD.parseInstances, instances)
+        return results
+    finally:
+        RMMUD.closeStateDatabase()
+        shutil.rmtree(work_dir, ignore_errors = True)
+
+def buildJar(mod_id: str, mod_version: str, mod_loader: str, size: int) -> bytes:
+    """Builds a deterministic mod jar of roughly the given size with the metadata file its loader expects."""
+    jar = io.BytesIO()
+    with zipfile.ZipFile(jar, 'w') as zip_file:
+        if mod_loader == 'forge':
+            zip_file.writestr(zipfile.ZipInfo('META-INF/mods.toml', (2020, 1, 1, 0, 0, 0)), f'[[mods]]\nmodId="{mod_id}"\nversion="{mod_version}"\n')
+        else:
+            zip_file.writestr(zipfile.ZipInfo('fabric.mod.json', (2020, 1, 1, 0, 0, 0)), json.dumps({'id': mod_id, 'version': mod_version}))
+        zip_file.writestr(zipfile.ZipInfo('data.bin', (2020, 1, 1, 0, 0, 0)), random.Random(f'{mod_id} {mod_version}').randbytes(size))
+    return jar.getvalue()
+
+class MockAPIServer:
+    """Local stand-in for the Modrinth and CurseForge APIs and their CDNs, serving synthetic projects and jars.
+    Every mod has a release for each benchmark loader and game version, and every resource pack one for each game version. Requests can be slowed down by a fixed
+    latency and fail with a 503 at a given rate."""
+    def __init__(self, project_count: int, jar_size: int, latency: float = 0.0, error_rate: float = 0.0, seed: int = 0) -> None:
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.error_count = 0
+        self.files: dict[str, bytes] = {}
+        self.modrinth_projects: dict[str, dict] = {}
+        self.modrinth_versions: dict[str, dict] = {}
+        self.curseforge_ids: dict[str, int] = {}
+        self.curseforge_files: dict[int, list[dict]] = {}
+
+        for i in range(project_count):
+            project_id = f'MR{i:06d}'
+            version_ids = []
+            for mod_loader in BENCHMARK_LOADERS:
+                for game_version in BENCHMARK_GAME_VERSIONS:
+                    version_id = f'{project_id}{mod_loader[:2].upper()}{game_version.replace(".", "")}'
+                    file_name = f'mr-mod-{i}-{mod_loader}-{game_version}.jar'
+                    jar = self.addFile(file_name, buildJar(f'mr_mod_{i}', f'{game_version}+1.0', mod_loader, jar_size))
+                    self.modrinth_versions[version_id] = {
+                        'id': version_id, 'project_id': project_id, 'version_number': f'{game_version}+1.0', 'version_type': 'release',
+                        'loaders': [mod_loader], 'game_versions': [game_version], 'date_published': '2024-01-01T00:00:00Z', 'dependencies': [],
+                        'files': [{'url': f'BASE/files/{file_name}', 'filename': file_name, 'primary': True, 'size': len(jar),
+                                   'hashes': {'sha1': hashlib.sha1(jar).hexdigest(), 'sha512': hashlib.sha512(jar).hexdigest()}}]
+                    }
+                    version_ids.append(version_id)
+            self.modrinth_projects[project_id] = {'id': project_id, 'slug': f'mr-mod-{i}', 'project_type': 'mod', 'versions': version_ids}
+
+            pack_id = f'MP{i:06d}'
+            version_ids = []
+            for game_version in BENCHMARK_GAME_VERSIONS:
+                version_id = f'{pack_id}{game_version.replace(".", "")}'
+                file_name = f'mr-pack-{i}-{game_version}.zip'
+                pack = self.addFile(file_name, buildJar(f'mr_pack_{i}', f'{game_version}+1.0', 'minecraft', jar_size))
+                self.modrinth_versions[version_id] = {
+                    'id': version_id, 'project_id': pack_id, 'version_number': f'{game_version}+1.0', 'version_type': 'release',
+                    'loaders': ['minecraft'], 'game_versions': [game_version], 'date_published': '2024-01-01T00:00:00Z', 'dependencies': [],
+                    'files': [{'url': f'BASE/files/{file_name}', 'filename': file_name, 'primary': True, 'size': len(pack),
+                               'hashes': {'sha1': hashlib.sha1(pack).hexdigest(), 'sha512': hashlib.sha512(pack).hexdigest()}}]
+                }
+                version_ids.append(version_id)
+            self.modrinth_projects[pack_id] = {'id': pack_id, 'slug': f'mr-pack-{i}', 'project_type': 'resourcepack', 'versions': version_ids}
+
+            curseforge_id = 100000 + i
+            self.curseforge_ids[f'cf-mod-{i}'] = curseforge_id
+            self.curseforge_files[curseforge_id] = []
+            for mod_loader in BENCHMARK_LOADERS:
+                for game_version in BENCHMARK_GAME_VERSIONS:
+                    file_name = f'cf-mod-{i}-{mod_loader}-{game_version}.jar'
+                    jar = self.addFile(file_name, buildJar(f'cf_mod_{i}', f'{game_version}+1.0', mod_loader, jar_size))
+                    self.curseforge_files[curseforge_id].append({
+                        'id': curseforge_id * 10 + len(self.curseforge_files[curseforge_id]), 'fileName': file_name, 'downloadUrl': f'BASE/files/{file_name}',
+                        'gameVersions': [game_version, mod_loader.capitalize()], 'modLoader': CURSEFORGE_LOADER_TYPES[mod_loader],
+                        'hashes': [{'algo': 1, 'value': hashlib.sha1(jar).hexdigest()}], 'dependencies': [],
+                        'releaseType': 1, 'fileDate': '2024-01-01T00:00:00Z'
+                    })
+
+            curseforge_id = 200000 + i
+            self.curseforge_ids[f'cf-pack-{i}'] = curseforge_id
+            self.curseforge_files[curseforge_id] = []
+            for game_version in BENCHMARK_GAME_VERSIONS:
+                file_name = f'cf-pack-{i}-{game_version}.zip'
+                pack = self.addFile(file_name, buildJar(f'cf_pack_{i}', f'{game_version}+1.0', 'minecraft', jar_size))
+                self.curseforge_files[curseforge_id].append({
+                    'id': curseforge_id * 10 + len(self.curseforge_files[curseforge_id]), 'fileName': file_name, 'downloadUrl': f'BASE/files/{file_name}',
+                    'gameVersions': [game_version], 'modLoader': None,
+                    'hashes': [{'algo': 1, 'value': hashlib.sha1(pack).hexdigest()}], 'dependencies': [],
+                    'releaseType': 1, 'fileDate': '2024-01-01T00:00:00Z'
+                })
+
+        server = self
+        class RequestHandler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, *args) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                server.handle(self)
+
+        self.http_server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), RequestHandler)
+        self.http_server.daemon_threads = True
+        self.base_url = f'http://127.0.0.1:{self.http_server.server_address[1]}'
+        self.thread = threading.Thread(target = self.http_server.serve_forever, daemon = True)
+
+    def addFile(self, file_name: str, data: bytes) -> bytes:
+        self.files[file_name] = data
+        return data
+
+    def start(self) -> 'MockAPIServer':
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.http_server.shutdown()
+        self.http_server.server_close()
+
+    def send(self, handler: http.server.BaseHTTPRequestHandler, status: int, body: bytes, content_type: str = 'application/json') -> None:
+        handler.send_response(status)
+        handler.send_header('Content-Type', content_type)
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def sendJSON(self, handler: http.server.BaseHTTPRequestHandler, data: typing.Any) -> None:
+        self.send(handler, 200, json.dumps(data).replace('BASE', self.base_url).encode('utf-8'))
+
+    def handle(self, handler: http.server.BaseHTTPRequestHandler) -> None:
+        url = urllib.parse.urlparse(handler.path)
+        query = {key: values[0] for key, values in urllib.parse.parse_qs(url.query).items()}
+        path = url.path.split('/')[1:]
+        with self.lock:
+            self.request_count += 1
+            fail = self.random.random() < self.error_rate
+            if fail:
+                self.error_count += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+        if fail:
+            return self.send(handler, 503, b'{}')
+
+        match path:
+            case ['modrinth', 'v2', 'projects']:
+                ids = json.loads(query.get('ids', '[]'))
+                return self.sendJSON(handler, [project for project in self.modrinth_projects.values() if project['id'] in ids or project['slug'] in ids])
+            case ['modrinth', 'v2', 'versions']:
+                return self.sendJSON(handler, [self.modrinth_versions[version_id] for version_id in json.loads(query.get('ids', '[]')) if version_id in self.modrinth_versions])
+            case ['curseforge', 'v1', 'mods', 'search']:
+                curseforge_id = self.curseforge_ids.get(query.get('slug', ''))
+                return self.sendJSON(handler, {'data': [{'id': curseforge_id}] if curseforge_id is not None else []})
+            case ['curseforge', 'v1', 'mods', curseforge_id, 'files']:
+                mod_loader = int(query['modLoaderType']) if query.get('modLoaderType') else None
+                files = [file for file in self.curseforge_files.get(int(curseforge_id), [])
+                         if query.get('gameVersion') in file['gameVersions'] and mod_loader in (None, file['modLoader'])]
+                index, page_size = int(query.get('index', 0)), int(query.get('pageSize', 50))
+                return self.sendJSON(handler, {'data': files[index:index + page_size],
+                                               'pagination': {'index': index, 'pageSize': page_size, 'resultCount': len(files[index:index + page_size]), 'totalCount': len(files)}})
+            case ['curseforge', 'v1', 'mods', curseforge_id, 'files', file_id]:
+                files = [file for file in self.curseforge_files.get(int(curseforge_id), []) if str(file['id']) == file_id]
+                if files:
+                    return self.sendJSON(handler, {'data': files[0]})
+            case ['files', file_name] if file_name in self.files:
+                return self.send(handler, 200, self.files[file_name], 'application/java-archive')
+        self.send(handler, 404, b'{}')
+
+def writeSyntheticPipeline(work_dir: str, server: MockAPIServer, instance_count: int, mods_per_instance: int, project_count: int, workers: int, packs_per_instance: int = 0) -> str:
+    """Writes a config file and instance files (with their mods folders) that point RMMUD at the mock server.
+    Returns the config file path."""
+    instances_dir = os.path.join(work_dir, 'RMMUDInstances')
+    os.makedirs(instances_dir)
+    for i in range(instance_count):
+        instance_dir = os.path.join(work_dir, 'instances', f'instance-{i}')
+        os.makedirs(os.path.join(instance_dir, 'mods'))
+        projects = [(i * 7 + j) % project_count for j in range(mods_per_instance)]
+        instance = {
+            'Enabled': True,
+            'Loader': BENCHMARK_LOADERS[i % len(BENCHMARK_LOADERS)],
+            'Version': BENCHMARK_GAME_VERSIONS[i // len(BENCHMARK_LOADERS) % len(BENCHMARK_GAME_VERSIONS)],
+            'Directory': instance_dir,
+            'Mods': [f'https://modrinth.com/mod/mr-mod-{project}' if j % 2 == 0 else f'https://www.curseforge.com/minecraft/mc-mods/cf-mod-{project}'
+                     for j, project in enumerate(projects)] +
+                    [f'https://modrinth.com/resourcepack/mr-pack-{project}' if j % 2 == 0 else f'https://www.curseforge.com/minecraft/texture-packs/cf-pack-{project}'
+                     for j, project in enumerate((i * 3 + j) % project_count for j in range(packs_per_instance))]
+        }
+        with open(os.path.join(instances_dir, f'Instance {i}.yaml'), 'w') as f:
+            yaml.dump(instance, f, sort_keys = False)
+
+    config_path = os.path.join(work_dir, 'RMMUDConfig.yaml')
+    with open(config_path, 'w') as f:
+        yaml.dump({
+            'CurseForge API Key': 'x' * 60,
+            'Check for RMMUD Updates': False,
+            'Downloads Folder': os.path.join(work_dir, 'RMMUDDownloads'),
+            'Instances Folder': instances_dir,
+            'Max Download Workers': workers,
+            'Modrinth API URL': f'{server.base_url}/modrinth/v2',
+            'CurseForge API URL': f'{server.base_url}/curseforge/v1',
+            'Download Dependencies': False
+        }, f)
+    return config_path
+
+def verifyStore() -> None:
+    """Re-hashes every file in the download store, as happens when the verified file index is cold."""
+    RMMUD.state_database.execute('DELETE FROM verified_files')
+    for (blob,) in RMMUD.state_database.execute('SELECT DISTINCT blob FROM store_manifest'):
+        RMMUD.verifyFile(RMMUD.download_store.blobPath(blob), {'sha1': blob})
+
+def benchmarkPipeline(instance_count: int, mods_per_instance: int, workers: int, latency: float, jar_size: int, error_rate: float, max_retries: int, packs_per_instance: int = 0) -> dict:
+    """Times every stage of a full cold run against the mock server, then a second run with nothing to do."""
+    project_count = max(1, mods_per_instance * 2, packs_per_instance * 2)
+    work_dir = tempfile.mkdtemp(prefix = 'RMMUDBenchmark')
+    server = MockAPIServer(project_count, jar_size, latency, error_rate).start()
+    stages: dict[str, float] = {}
+
+    def stage(name: str, function, *args) -> typing.Any:
+        start = time.perf_counter()
+        result = function(*args)
+        stages[name] = time.perf_counter() - start
+        return result
+
+    try:
+        config = RMMUD.loadConfigFile(writeSyntheticPipeline(work_dir, server, instance_count, mods_per_instance, project_count, workers, packs_per_instance))
+        config['HTTP Max Retries'] = max_retries
+        RMMUD.setupStateDatabase(config)
+        client = RMMUD.setupHTTPClient(config)
+
+        instances = stage('load instances', RMMUD.loadInstances, config['Instances Folder'], workers)
+        stage('parse instances', RMMUD.parseInstances, instances)
+        plan = stage('resolve', RMMUD.planUpdate, instances, config)
+        stage('download', RMMUD.runJobs, RMMUD.storeResolvedFile, [(install['file'], config) for install in plan['installs']], workers)
+        stage('verify', verifyStore)
+        stage('copy', RMMUD.executePlan, plan, config)
+        stage('delete duplicates', RMMUD.deleteDuplicateMods, instances, plan['deployed'])
+        stage('no-change run', lambda: RMMUD.deleteDuplicateMods(instances, RMMUD.updateMods(RMMUD.loadInstances(config['Instances Folder'], workers), config)))
+
+        return {
+            'rmmud_version': RMMUD.__version__,
+            'parameters': {
+                'instances': instance_count, 'mods_per_instance': mods_per_instance, 'packs_per_instance': packs_per_instance, 'projects': project_count * 4, 'workers': workers,
+                'latency': latency, 'jar_size': jar_size, 'error_rate': error_rate, 'max_retries': max_retries
+            },
+            'stages': stages,
+            'total': sum(stages.values()),
+            'files_deployed': sum(len(install['targets']) for install in plan['installs']),
+            'unresolved': len(plan['failed']),
+            'http': {'requests': client.request_count, 'retries': client.retry_count, 'bytes_received': client.bytes_received},
+            'server': {'requests': server.request_count, 'errors': server.error_count}
+        }
+    finally:
+        RMMUD.closeStateDatabase()
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors = True)
+
+def writeSyntheticJars(work_dir: str, jar_count: int, folder_count: int, jar_size: int) -> tuple[list[tuple[str, str]], list[tuple[str, str]]]:
+    """Writes jar_count fabric jars of compressed class files spread over folder_count mods folders, one in ten of them a
+    newer version of an earlier jar's mod. Returns the (mods folder, loader) list and the (path, sha1) of every jar."""
+    folders = [(os.path.join(work_dir, f'instance-{i}', 'mods'), 'fabric') for i in range(folder_count)]
+    files: list[tuple[str, str]] = []
+    for mods_dir, _ in folders:
+        os.makedirs(mods_dir)
+    for i in range(jar_count):
+        mod_id = f'scan_mod_{i - i % 10 if i % 10 == 9 else i}'
+        rng = random.Random(i)
+        jar = io.BytesIO()
+        with zipfile.ZipFile(jar, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            zip_file.writestr('fabric.mod.json', json.dumps({'id': mod_id, 'version': f'1.0.{i % 10}', 'name': mod_id, 'entrypoints': {'main': [f'com.example.{mod_id}.Mod']}}))
+            for j in range(max(1, jar_size // 2048)):
+                zip_file.writestr(f'com/example/{mod_id}/Class{j}.class', bytes(rng.choices(b'\x00\x01\x02abcdefLjava/lang/Object;()V', k = 2048)))
+        data = jar.getvalue()
+        path = os.path.join(folders[i // 10 % folder_count][0], f'scan-mod-{i}.jar')
+        with open(path, 'wb') as f:
+            f.write(data)
+        files.append((path, hashlib.sha1(data).hexdigest()))
+    return folders, files
+
+def benchmarkScanning(jar_count: int, folder_count: int, jar_size: int, max_workers: int) -> dict:
+    """Times reading the mod metadata of every jar (as deleting duplicate mods does with a cold mod file index), hashing
+    every jar and testing every jar as a ZIP file, on one process and on increasing numbers of worker processes."""
+    work_dir = tempfile.mkdtemp(prefix = 'RMMUDBenchmark')
+    try:
+        folders, files = writeSyntheticJars(work_dir, jar_count, folder_count, jar_size)
+        worker_counts = sorted({1, max_workers, *(2 ** i for i in range(1, max_workers.bit_length()))})
+        stages: dict[str, float] = {}
+        verified = 0
+        for workers in worker_counts:
+            stages[f'metadata scan, {workers} process(es)'] = timeIt(RMMUD.scanModFolders, folders, workers)
+            start = time.perf_counter()
+            verified = sum(RMMUD.verifyFiles([(path, {'sha1': sha1}) for path, sha1 in files], workers))
+            stages[f'hash verification, {workers} process(es)'] = time.perf_counter() - start
+            stages[f'ZIP test, {workers} process(es)'] = timeIt(RMMUD.verifyFiles, [(path, {}) for path, _ in files], workers)
+        return {
+            'rmmud_version': RMMUD.__version__,
+            'parameters': {'jars': jar_count, 'folders': folder_count, 'jar_size': jar_size, 'max_workers': max_workers, 'cpu_count': os.cpu_count()},
+            'stages': stages,
+            'jars_verified': verified
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors = True)
+
+def timeRun(work_dir: str) -> tuple[float, float]:
+    """Runs RMMUD.py the way a scheduled task would (no terminal attached) and returns how many seconds it took to start
+    planning the update and to exit."""
+    start = time.perf_counter()
+    first_work = None
+    process = subprocess.Popen([sys.executable, os.path.abspath(RMMUD.__file__)], cwd = work_dir, stdin = subprocess.DEVNULL,
+                               stdout = subprocess.PIPE, stderr = subprocess.STDOUT, text = True, encoding = 'utf-8')
+    for line in process.stdout:
+        if first_work is None and 'PLANNING UPDATE' in line:
+            first_work = time.perf_counter() - start
+    if process.wait() != 0:
+        raise RuntimeError(f'RMMUD.py exited with code {process.returncode}')
+    total = time.perf_counter() - start
+    return first_work if first_work is not None else total, total
+
+def benchmarkStartup(instance_count: int, mods_per_instance: int, runs: int) -> dict:
+    """Times launching RMMUD.py on instances that are already up to date, after one run that installed everything."""
+    project_count = max(1, mods_per_instance * 2)
+    work_dir = tempfile.mkdtemp(prefix = 'RMMUDBenchmark')
+    server = MockAPIServer(project_count, 1024).start()
+    try:
+        writeSyntheticPipeline(work_dir, server, instance_count, mods_per_instance, project_count, 8)
+        timeRun(work_dir)
+        requests_before = server.request_count
+        first_work, totals = zip(*(timeRun(work_dir) for _ in range(runs)))
+        return {
+            'rmmud_version': RMMUD.__version__,
+            'parameters': {'instances': instance_count, 'mods_per_instance': mods_per_instance, 'runs': runs},
+            'stages': {'time to first work (median)': statistics.median(first_work), 'no-op run (median)': statistics.median(totals)},
+            'target': TIME_TO_FIRST_WORK_TARGET,
+            'meets_target': statistics.median(first_work) <= TIME_TO_FIRST_WORK_TARGET,
+            'requests_per_run': (server.request_count - requests_before) / runs
+        }
+    finally:
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors = True)
+
+def parseArguments(args: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description = 'Benchmarks for RMMUD')
+    parser.add_argument('benchmark', choices = ('instances', 'pipeline', 'scan', 'startup'),
+                        help = 'instances: load and parse a folder of synthetic instance files. pipeline: time every stage of a run against a local mock API server. ' +
+                               'scan: read, hash and test thousands of synthetic jars on increasing numbers of worker processes. ' +
+                               'startup: time launching RMMUD.py when there is nothing to update.')
+    parser.add_argument('--instances', type = int, default = None, help = 'Number of synthetic instances (default 1000 for instances, 20 for the others).')
+    parser.add_argument('--mods', type = int, default = None, help = 'Number of mods in each synthetic instance (default 50 for instances, 30 for the others).')
+    parser.add_argument('--packs', type = int, default = 0, help = 'Number of resource packs in each synthetic instance for pipeline.')
+    parser.add_argument('--jars', type = int, default = 3000, help = 'Number of synthetic jars to scan.')
+    parser.add_argument('--runs', type = int, default = 5, help = 'Number of times to launch RMMUD.py for startup.')
+    parser.add_argument('--workers', type = int, default = 8, help = 'Number of worker threads, or the most worker processes for scan.')
+    parser.add_argument('--latency', type = float, default = 0.0, help = 'Seconds the mock server waits before answering each request.')
+    parser.add_argument('--jar-size', type = int, default = 64 * 1024, help = 'Size in bytes of the payload in each synthetic jar.')
+    parser.add_argument('--error-rate', type = float, default = 0.0, help = 'Fraction of mock server requests answered with a 503.')
+    parser.add_argument('--max-retries', type = int, default = 5, help = 'HTTP Max Retries to run with.')
+    parser.add_argument('--json', action = 'store_true', help = 'Print the results as JSON.')
+    parser.add_argument('--output', default = None, help = 'Also write the JSON results to this file.')
+    return parser.parse_args(args)
+
+def main(arguments: argparse.Namespace) -> None:
+    if arguments.benchmark == 'instances':
+        results = benchmarkInstanceLoading(arguments.instances or 1000, arguments.mods or 50, arguments.workers)
+    elif arguments.benchmark == 'startup':
+        results = benchmarkStartup(arguments.instances or 20, arguments.mods or 30, arguments.runs)
+    elif arguments.benchmark == 'scan':
+        results = benchmarkScanning(arguments.jars, arguments.instances or 20, arguments.jar_size, arguments.workers)
+    else:
+        results = benchmarkPipeline(arguments.instances or 20, arguments.mods or 30, arguments.workers, arguments.latency,
+                                    arguments.jar_size, arguments.error_rate, arguments.max_retries, arguments.packs)
+
+    if arguments.output is not None:
+        with open(arguments.output, 'w') as f:
+            json.dump(results, f, indent = 4)
+    if arguments.json:
+        print(json.dumps(results, indent = 4))
+    else:
+        for name, seconds in results.get('stages', results).items():
+            print(f'{name}: {seconds:.3f}s')
+        if 'stages' in results:
+            for name, value in results.items():
+                if name != 'stages':
+                    print(f'{name}: {value}')
+
+if __name__ == '__main__':
+    logging.basicConfig(level = logging.WARNING, format = '%(levelname)s: %(message)s', stream = sys.stdout)
+    main(parseArguments())
@@ -0,0 +1,84 @@
+import os
+import sys
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import RMMUD
+
+def baselineParseModURL(mod_url: str) -> tuple[str, str, str] | None:
+    """parseModURL as it was before the ModJob model, when only mods were supported."""
+    parsed_url = urlparse(mod_url)
+    url_authority = parsed_url.netloc
+    mod_version = 'latest_version'
+    if url_authority == "": return None
+    url_authority = url_authority.lstrip('www.')
+    url_path_split = parsed_url.path.split('/')[1:]
+    if url_authority == 'modrinth.com':
+        if url_path_split[0] not in ('mod', 'plugin', 'datapack'):
+            return None
+        mod_id = url_path_split[1]
+        if len(url_path_split) == 4 and url_path_split[2] == 'version':
+            mod_version = url_path_split[3]
+    elif url_authority == 'curseforge.com':
+        if url_path_split[0] != 'minecraft' or url_path_split[1] != 'mc-mods':
+            return None
+        mod_id = url_path_split[2]
+        if len(url_path_split) == 5 and url_path_split[3] == 'files':
+            mod_version = url_path_split[4]
+    else:
+        return None
+    return url_authority, mod_id, mod_version
+
+def baselineParseInstances(instances: RMMUD.Instances) -> dict:
+    """The nested ParsedInstances grouping parseInstances built before the ModJob model."""
+    parsed_instances = {}
+    for instance in instances.values():
+        mod_loader = str(instance['Loader']).lower()
+        minecraft_version = str(instance['Version'])
+        instance_dir = str(instance['Directory'])
+        for mod_url in RMMUD.extractNestedStrings(instance['Mods']):
+            parsed_url = baselineParseModURL(mod_url)
+            if parsed_url is None:
+                continue
+            url_authority, mod_id, mod_version = parsed_url
+            directories = parsed_instances.setdefault(mod_loader, {}).setdefault('mods', {}).setdefault(minecraft_version, {}).setdefault(mod_id, {}).setdefault(url_authority, {}).setdefault(mod_version, {}).setdefault('directories', [])
+            if instance_dir not in directories:
+                directories.append(instance_dir)
+    return parsed_instances
+
+def baselineJobs(parsed_instances: dict) -> dict[RMMUD.ModKey, list[str]]:
+    """Flattens the nested grouping the way listModJobs did. Unpinned mods were 'latest_version', which is now the newest release."""
+    jobs = {}
+    for mod_loader, loader_mods in parsed_instances.items():
+        for minecraft_version, version_mods in loader_mods['mods'].items():
+            for mod_id, sites in version_mods.items():
+                for website, mod_versions in sites.items():
+                    for mod_version, job in mod_versions.items():
+                        mod_version = RMMUD.latestVersion('release') if mod_version == 'latest_version' else mod_version
+                        jobs[RMMUD.ModKey(website, mod_id, mod_loader, minecraft_version, mod_version)] = sorted(job['directories'])
+    return jobs
+
+def test_sameGroupingAsBaseline(tmp_path):
+    first_dir, second_dir, forge_dir = str(tmp_path / 'first'), str(tmp_path / 'second'), str(tmp_path / 'forge')
+    instances = {
+        'First': {'Loader': 'Fabric', 'Version': '1.20.2', 'Directory': first_dir, 'Mods': {
+            'Libraries': ['https://modrinth.com/mod/fabric-api', 'https://www.curseforge.com/minecraft/mc-mods/cloth-config'],
+            'Pinned': ['https://modrinth.com/mod/sodium/version/mc1.20.2-0.5.3', 'https://www.curseforge.com/minecraft/mc-mods/jei/files/4712866'],
+            'Other': ['https://modrinth.com/plugin/luckperms'], # Datapack links were handled as mods and are now installed into the world
+            'Disabled': ['modrinth.com/mod/iris', '#https://modrinth.com/mod/lithium', ''],
+            'Unsupported': ['https://github.com/RandomGgames/RMMUD', 'https://modrinth.com/modpack/fabulously-optimized']
+        }},
+        'Second': {'Loader': 'fabric', 'Version': '1.20.2', 'Directory': second_dir, 'Mods': [
+            'https://modrinth.com/mod/fabric-api', 'https://modrinth.com/mod/sodium', 'https://modrinth.com/mod/sodium/version/mc1.20.2-0.5.3'
+        ]},
+        'Second Copy': {'Loader': 'fabric', 'Version': '1.20.2', 'Directory': second_dir, 'Mods': ['https://modrinth.com/mod/fabric-api', 'https://modrinth.com/mod/fabric-api']},
+        'Forge': {'Loader': 'forge', 'Version': '1.20.1', 'Directory': forge_dir, 'Mods': [
+            'https://modrinth.com/mod/fabric-api', 'https://www.curseforge.com/minecraft/mc-mods/jei/files/4712866'
+        ]}
+    }
+    
+    jobs = RMMUD.parseInstances(instances)
+    
+    assert {key: sorted(job.directories) for key, job in jobs.items()} == baselineJobs(baselineParseInstances(instances))
+    assert jobs[RMMUD.ModKey('modrinth.com', 'fabric-api', 'fabric', '1.20.2', 'latest_release')].directories == {first_dir, second_dir}
+    assert jobs[RMMUD.ModKey('modrinth.com', 'fabric-api', 'fabric', '1.20.2', 'latest_release')].instances == {'First', 'Second', 'Second Copy'}